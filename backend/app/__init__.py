@@ -0,0 +1,6 @@
+from dotenv import load_dotenv
+
+from .startup import startup  # noqa: F401  (starts the clock before any other app module loads)
+
+# Once, before any submodule reads os.getenv at import time
+load_dotenv()
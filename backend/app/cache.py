@@ -0,0 +1,297 @@
+import asyncio
+import threading
+import time
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+def normalize_key(text: str) -> str:
+    """Collapse whitespace and case so 'Chennai ' and 'chennai' share an entry."""
+    return " ".join((text or "").split()).casefold()
+
+
+class CacheBackend:
+    """Where a TTLCache keeps its entries.
+
+    Expiry is passed around as seconds remaining, so a backend may use
+    whatever clock it likes (wall time for one shared between processes).
+    Expired entries stay readable until evicted; TTLCache.peek() serves them.
+    Backends are thread-safe on their own; TTLCache calls them without its lock.
+    One that does blocking I/O sets `executor`, and the async TTLCache methods
+    run its calls there instead of on the event loop.
+    """
+
+    name = "base"
+    executor = None
+
+    def get(self, key: Hashable, touch: bool = True) -> Tuple[Any, float]:
+        """(value, seconds left) or (_MISSING, 0.0); seconds left is <= 0 once expired."""
+        raise NotImplementedError
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> int:
+        """Store an entry; returns how many entries were evicted to make room."""
+        raise NotImplementedError
+
+    def set_newer(self, key: Hashable, value: Any, ttl: float) -> int:
+        """Store a [version, payload] entry unless the one already there has a higher version.
+
+        The check and the write are one atomic step. Returns evictions, as set() does.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: Hashable) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def size(self) -> int:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """Per-process LRU: an OrderedDict of key -> (monotonic expiry, value)."""
+
+    name = "memory"
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = max(1, int(maxsize))
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, touch: bool = True) -> Tuple[Any, float]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING, 0.0
+            left = item[0] - time.monotonic()
+            if touch and left > 0:
+                self._data.move_to_end(key)
+            return item[1], left
+
+    def _put(self, key: Hashable, value: Any, ttl: float) -> int:
+        # Caller must hold the lock
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        evicted = 0
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            evicted += 1
+        return evicted
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> int:
+        with self._lock:
+            return self._put(key, value, ttl)
+
+    def set_newer(self, key: Hashable, value: Any, ttl: float) -> int:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1][0] > value[0]:
+                return 0
+            return self._put(key, value, ttl)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry and single-flight loading.
+
+    Concurrent misses for the same key in get_or_load() share one loader call;
+    the extra callers are counted as "coalesced" rather than misses.
+    Single-flight and the counters are per process even when the backend
+    is shared. The lock only guards those; backend calls happen outside it,
+    so a miss racing a completing load may, rarely, load the key twice.
+    Coroutines use the a*() methods, which keep backend I/O off the loop.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0, backend: Optional[CacheBackend] = None):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.backend = backend or MemoryBackend(self.maxsize)
+        self._inflight: Dict[Hashable, Future] = {}
+        self._tasks: "set[asyncio.Task]" = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def _io(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Call fn (which talks to the backend) in the backend's executor, if it has one."""
+        if self.backend.executor is None:
+            return fn(*args)
+        return await asyncio.get_running_loop().run_in_executor(self.backend.executor, partial(fn, *args))
+
+    def _lookup(self, key: Hashable) -> Any:
+        value, left = self.backend.get(key)
+        if left <= 0:
+            # Expired entries stay until overwritten or evicted so peek() can serve them
+            return _MISSING
+        return value
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float], newer: bool = False) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        evicted = (self.backend.set_newer if newer else self.backend.set)(key, value, ttl)
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+
+    def _counted(self, value: Any, default: Any) -> Any:
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def _peek(self, key: Hashable) -> Tuple[Any, float]:
+        return self.backend.get(key, touch=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        return self._counted(self._lookup(key), default)
+
+    async def aget(self, key: Hashable, default: Any = None) -> Any:
+        return self._counted(await self._io(self._lookup, key), default)
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Return an entry even if it has expired; doesn't touch LRU order or counters."""
+        value, _ = self._peek(key)
+        return default if value is _MISSING else value
+
+    async def apeek(self, key: Hashable, default: Any = None) -> Any:
+        value, _ = await self._io(self._peek, key)
+        return default if value is _MISSING else value
+
+    def ttl_remaining(self, key: Hashable) -> float:
+        """Seconds until the entry expires (0 if missing or expired); doesn't touch counters."""
+        _, left = self._peek(key)
+        return max(0.0, left)
+
+    async def attl_remaining(self, key: Hashable) -> float:
+        _, left = await self._io(self._peek, key)
+        return max(0.0, left)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        self._store(key, value, ttl)
+
+    async def aset(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        await self._io(self._store, key, value, ttl)
+
+    def set_newer(self, key: Hashable, version: float, value: Any, ttl: Optional[float] = None) -> None:
+        """Cache [version, value], unless another writer (in any process sharing the backend) cached a newer version."""
+        self._store(key, [version, value], ttl, newer=True)
+
+    async def aset_newer(self, key: Hashable, version: float, value: Any, ttl: Optional[float] = None) -> None:
+        await self._io(self._store, key, [version, value], ttl, True)
+
+    def delete(self, key: Hashable) -> None:
+        self.backend.delete(key)
+
+    async def adelete(self, key: Hashable) -> None:
+        await self._io(self.backend.delete, key)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def _claim(self, key: Hashable, value: Any) -> "tuple[Any, Optional[Future], bool]":
+        """Given the backend lookup for key, return (value, None, False) on a hit,
+        else the in-flight future and whether this caller owns the load."""
+        with self._lock:
+            if value is not _MISSING:
+                self.hits += 1
+                return value, None, False
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self.coalesced += 1
+                return None, fut, False
+            self.misses += 1
+            fut = Future()
+            self._inflight[key] = fut
+            return None, fut, True
+
+    def _release(self, key: Hashable, fut: Future, value: Any) -> None:
+        # Called once the value is stored (or storing failed; the load still succeeded)
+        with self._lock:
+            self._inflight.pop(key, None)
+        fut.set_result(value)
+
+    def _abandon(self, key: Hashable, fut: Future, exc: BaseException) -> None:
+        # Errors are never cached; waiters see the same exception
+        with self._lock:
+            self._inflight.pop(key, None)
+        fut.set_exception(exc)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        value, fut, owner = self._claim(key, self._lookup(key))
+        if fut is None:
+            return value
+        if not owner:
+            return fut.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            self._abandon(key, fut, e)
+            raise
+        try:
+            self._store(key, value, ttl)
+        except Exception:
+            pass
+        finally:
+            self._release(key, fut, value)
+        return value
+
+    async def aget_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]], ttl: Optional[float] = None) -> Any:
+        """Async twin of get_or_load(); shares in-flight loads with sync callers."""
+        value, fut, owner = self._claim(key, await self._io(self._lookup, key))
+        if fut is None:
+            return value
+        if owner:
+            # The load runs as its own task, so cancelling the caller that started it
+            # doesn't cancel it for everyone coalesced on the same key
+            task = asyncio.ensure_future(self._aload(key, fut, loader, ttl))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await asyncio.shield(asyncio.wrap_future(fut))
+
+    async def _aload(self, key: Hashable, fut: Future, loader: Callable[[], Awaitable[Any]], ttl: Optional[float]) -> None:
+        try:
+            value = await loader()
+        except BaseException as e:
+            # Callers see the error through fut; only re-raise a cancellation of this task itself
+            self._abandon(key, fut, e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return
+        try:
+            await self._io(self._store, key, value, ttl)
+        except Exception:
+            pass  # a failed cache write must not fail the callers; the value is still good
+        finally:
+            self._release(key, fut, value)
+
+    def stats(self) -> Dict[str, Any]:
+        size = self.backend.size()
+        with self._lock:
+            return {
+                "size": size,
+                "maxsize": self.maxsize,
+                "backend": self.backend.name,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,173 @@
+import os
+import json
+import unicodedata
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+TN_CITIES = [
+    "Chennai", "Coimbatore", "Madurai", "Tiruchirappalli", "Salem", "Tirunelveli", "Erode", "Vellore", "Thoothukudi", "Tiruppur",
+    "Dindigul", "Thanjavur", "Kanchipuram", "Nagercoil", "Karur", "Cuddalore", "Nagapattinam", "Pudukkottai", "Sivagangai",
+]
+
+# canonical -> (Tamil-script names, aliases and common transliterations)
+CITY_ALIASES: Dict[str, Tuple[List[str], List[str]]] = {
+    "Chennai": (["சென்னை", "மெட்ராஸ்"], ["Madras", "Chenai"]),
+    "Coimbatore": (["கோயம்புத்தூர்", "கோவை"], ["Kovai", "Koyamputhur", "Coimbatur"]),
+    "Madurai": (["மதுரை"], ["Mathurai"]),
+    "Tiruchirappalli": (["திருச்சிராப்பள்ளி", "திருச்சி"], ["Trichy", "Tiruchi", "Tiruchirapalli", "Trichirappalli"]),
+    "Salem": (["சேலம்"], ["Selam"]),
+    "Tirunelveli": (["திருநெல்வேலி", "நெல்லை"], ["Nellai", "Thirunelveli"]),
+    "Erode": (["ஈரோடு"], ["Eerodu"]),
+    "Vellore": (["வேலூர்"], ["Velur"]),
+    "Thoothukudi": (["தூத்துக்குடி"], ["Tuticorin", "Thoothukkudi", "Toothukudi"]),
+    "Tiruppur": (["திருப்பூர்"], ["Tirupur", "Thiruppur"]),
+    "Dindigul": (["திண்டுக்கல்"], ["Dindukkal"]),
+    "Thanjavur": (["தஞ்சாவூர்", "தஞ்சை"], ["Tanjore", "Thanjai"]),
+    "Kanchipuram": (["காஞ்சிபுரம்", "காஞ்சி"], ["Kancheepuram", "Conjeevaram", "Kanchi"]),
+    "Nagercoil": (["நாகர்கோவில்"], ["Nagarkovil", "Nagerkovil"]),
+    "Karur": (["கரூர்"], []),
+    "Cuddalore": (["கடலூர்"], ["Kadalur"]),
+    "Nagapattinam": (["நாகப்பட்டினம்", "நாகை"], ["Nagai"]),
+    "Pudukkottai": (["புதுக்கோட்டை"], ["Pudukottai"]),
+    "Sivagangai": (["சிவகங்கை"], ["Sivaganga"]),
+}
+
+# Extra towns/aliases: JSON object {"Canonical": ["alias", ...], ...}
+CITY_ALIASES_PATH = os.getenv("CITY_ALIASES_PATH", "")
+
+CONFIDENCE_CANONICAL = 1.0
+CONFIDENCE_ALIAS = 0.9
+# Tamil is agglutinative ("சென்னையில்" = "in Chennai"), so Tamil-script
+# names may be followed by a suffix, at a small confidence cost
+SUFFIX_PENALTY = 0.1
+
+
+def _normalize(text: str) -> str:
+    return unicodedata.normalize("NFC", text).casefold()
+
+
+def _is_word_char(ch: str) -> bool:
+    # Combining marks (Tamil vowel signs, virama) belong to the word they follow
+    return ch.isalnum() or unicodedata.category(ch).startswith("M")
+
+
+def _is_tamil(text: str) -> bool:
+    return any("஀" <= ch <= "௿" for ch in text)
+
+
+class CityMatcher:
+    """Aho-Corasick automaton over city names and aliases.
+
+    Built once; match() is a single pass over the transcript, so its cost
+    depends on the transcript length and not on how many names are loaded.
+    Matches must start and end on word boundaries; Tamil-script names may
+    be followed by a case suffix.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str, float]]):
+        # Trie as parallel lists: goto[state] maps char -> state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # state -> [(canonical, pattern, confidence, tamil)]
+        self._out: List[List[Tuple[str, str, float, bool]]] = [[]]
+        self.size = 0
+        for canonical, pattern, confidence in entries:
+            self._add(canonical, _normalize(pattern.strip()), confidence)
+        self._build()
+
+    def _add(self, canonical: str, pattern: str, confidence: float) -> None:
+        if not pattern:
+            return
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((canonical, pattern, confidence, _is_tamil(pattern)))
+        self.size += 1
+
+    def _build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, transcript: str) -> List[Dict[str, Any]]:
+        text = _normalize(transcript)
+        found: List[Dict[str, Any]] = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for canonical, pattern, confidence, tamil in self._out[state]:
+                start = i - len(pattern) + 1
+                if start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                end = i + 1
+                if end < len(text) and _is_word_char(text[end]):
+                    if not tamil:
+                        continue
+                    confidence -= SUFFIX_PENALTY
+                found.append({"city": canonical, "confidence": round(confidence, 2), "matched": pattern, "start": start})
+        return found
+
+    def canonical(self, name: str) -> Optional[str]:
+        """Canonical city if the whole of `name` is a known name or alias ("Trichy" -> "Tiruchirappalli")."""
+        text = _normalize(" ".join(name.split()))
+        state = 0
+        for ch in text:
+            state = self._goto[state].get(ch)
+            if state is None:
+                return None
+        for canonical, pattern, _, _ in self._out[state]:
+            if pattern == text:
+                return canonical
+        return None
+
+    def match(self, transcript: str) -> Optional[Dict[str, Any]]:
+        """Best match as {city, confidence, matched, start}, or None."""
+        found = self.find_all(transcript)
+        if not found:
+            return None
+        # Highest confidence, then longest name, then earliest mention
+        return max(found, key=lambda m: (m["confidence"], len(m["matched"]), -m["start"]))
+
+
+def _load_extra_aliases(path: str) -> Dict[str, List[str]]:
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return {str(k): [str(a) for a in v] for k, v in data.items()}
+    except Exception:
+        return {}
+
+
+def build_city_matcher(cities: List[str] = TN_CITIES) -> CityMatcher:
+    entries: List[Tuple[str, str, float]] = []
+    for city in cities:
+        entries.append((city, city, CONFIDENCE_CANONICAL))
+        tamil, aliases = CITY_ALIASES.get(city, ([], []))
+        entries.extend((city, name, CONFIDENCE_CANONICAL) for name in tamil)
+        entries.extend((city, name, CONFIDENCE_ALIAS) for name in aliases)
+    for city, aliases in _load_extra_aliases(CITY_ALIASES_PATH).items():
+        entries.append((city, city, CONFIDENCE_CANONICAL))
+        entries.extend((city, name, CONFIDENCE_ALIAS) for name in aliases)
+    return CityMatcher(entries)
+
+
+city_matcher = build_city_matcher()
@@ -1,18 +1,28 @@
 import os
-from typing import Dict, Any
-from dotenv import load_dotenv
+import re
+import json
+import time
+import threading
+import importlib.util
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from functools import partial
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
 
-# Ensure .env is loaded before reading environment variables
-load_dotenv()
+from .gemini_cache import response_key, get_cached_response, store_response, is_valid_bilingual
+from .model_router import ModelRouter, AllModelsFailed
+from .ratelimit import Shed, acquire_gemini, current_deadline, set_deadline
+from .metrics import GEMINI_LATENCY, GEMINI_PARSE_LATENCY, GEMINI_FALLBACK_HOPS, GEMINI_DETERMINISTIC, GEMINI_HEDGES
+from .startup import startup
+from .profiler import attributed
 
-try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except Exception:
-    GENAI_AVAILABLE = False
+# The SDK itself is imported on first use (see _sdk()); it adds seconds to worker boot
+GENAI_AVAILABLE = importlib.util.find_spec("google.generativeai") is not None
 
 GEMINI_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+# Optional API host override (e.g. a local stand-in for benchmarks); implies the REST transport
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT", "")
 
 FALLBACK_MODELS = [
     "gemini-2.5-flash",
@@ -26,20 +36,68 @@ FALLBACK_MODELS = [
     "gemini-1.5-pro",
 ]
 
-if GENAI_AVAILABLE and GEMINI_KEY:
-    genai.configure(api_key=GEMINI_KEY)
-    try:
-        model = genai.GenerativeModel(GEMINI_MODEL)
-    except Exception:
-        model = None
-else:
-    model = None
+GEMINI_CONFIGURED = GENAI_AVAILABLE and bool(GEMINI_KEY)
 
-PROMPT_TEMPLATE = (
-"""
+_genai: Any = None
+_genai_lock = threading.Lock()
+
+
+def _sdk() -> Any:
+    """google.generativeai, imported and configured once on first use (thread-safe)."""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                with startup.phase("sdk"):
+                    import google.generativeai as genai
+                    if GEMINI_API_ENDPOINT:
+                        genai.configure(api_key=GEMINI_KEY, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                    else:
+                        genai.configure(api_key=GEMINI_KEY)
+                _genai = genai
+    return _genai
+
+
+# One long-lived GenerativeModel per ID, built on first use and tried healthiest-first
+router = ModelRouter(
+    [GEMINI_MODEL] + [m for m in FALLBACK_MODELS if m != GEMINI_MODEL],
+    lambda name: _sdk().GenerativeModel(name),
+)
+
+
+def warm_gemini() -> None:
+    """Import the SDK and build the primary model ahead of the first request."""
+    if GEMINI_CONFIGURED:
+        router.get_model(GEMINI_MODEL)
+
+# Shared prompt sections; the single-city and batch templates differ only in
+# the context block and the expected output shape.
+_PERSONA = """
 You are **Maya**, a warm, friendly, and emotionally intelligent **weather voice assistant** designed for users in **Tamil Nadu**.  
 Your goal is to deliver **hyperlocal weather updates**, **clothing/travel suggestions**, and **friendly emotional remarks** that feel caring and human.
+"""
+
+_STYLE_GUIDE = """Tone & Style Guidelines:
+- Speak naturally in a **Tamil-English mix** (Tanglish) — friendly, conversational, and regionally relatable.
+- Use short, emotionally warm sentences — imagine speaking to a friend.
+- Be culturally aware — mention things like heat, rain, or humidity in Tamil Nadu context (e.g., “mazhai”, “velicham”, “kulir”).
+- Give useful, **actionable advice** (like what to wear, whether to carry an umbrella, etc.).
+- Always end with a short **emotional or mood-based line** (e.g., “Stay cool and happy!”, “Enjoy the breeze!”, “Innaikku super pleasant-a iruku!”).
+
+"""
+
+_EXAMPLES = """Example Behavior:
+If it’s raining — suggest carrying an umbrella, mention “mazhai”.
+If it’s sunny — suggest wearing cotton clothes, mention “velicham”.
+If it’s humid — suggest staying hydrated.
+If it’s pleasant — express joy and relaxation.
 
+Your reply should feel like a short chat with a friend, not a robotic forecast.
+"""
+
+PROMPT_TEMPLATE = (
+    _PERSONA
+    + """
 Context Data:
 City: {city}
 Temperature: {temp}°C
@@ -49,14 +107,9 @@ Chance of Rain: {rain_chance}%
 
 User’s Query: "{user_query}"
 
-Tone & Style Guidelines:
-- Speak naturally in a **Tamil-English mix** (Tanglish) — friendly, conversational, and regionally relatable.
-- Use short, emotionally warm sentences — imagine speaking to a friend.
-- Be culturally aware — mention things like heat, rain, or humidity in Tamil Nadu context (e.g., “mazhai”, “velicham”, “kulir”).
-- Give useful, **actionable advice** (like what to wear, whether to carry an umbrella, etc.).
-- Always end with a short **emotional or mood-based line** (e.g., “Stay cool and happy!”, “Enjoy the breeze!”, “Innaikku super pleasant-a iruku!”).
-
-Expected Output Format (JSON):
+"""
+    + _STYLE_GUIDE
+    + """Expected Output Format (JSON):
 {{
     "english": "Friendly English response summarizing the weather and mood",
     "tamil": "Tanglish version of the same message (Tamil + English mix)",
@@ -64,98 +117,511 @@ Expected Output Format (JSON):
     "mood_reply": "Short, emotional closing line to make user smile"
 }}
 
-Example Behavior:
-If it’s raining — suggest carrying an umbrella, mention “mazhai”.
-If it’s sunny — suggest wearing cotton clothes, mention “velicham”.
-If it’s humid — suggest staying hydrated.
-If it’s pleasant — express joy and relaxation.
+"""
+    + _EXAMPLES
+)
+
+BATCH_PROMPT_TEMPLATE = (
+    _PERSONA
+    + """
+You are answering for several cities at once. Context Data, one line per city:
+{city_lines}
 
-Your reply should feel like a short chat with a friend, not a robotic forecast.
 """
+    + _STYLE_GUIDE
+    + """Expected Output Format (JSON array, exactly one object per city above, same "id" and "city"):
+[
+  {{
+    "id": 0,
+    "city": "City name exactly as given",
+    "english": "Friendly English response summarizing the weather and mood",
+    "tamil": "Tanglish version of the same message (Tamil + English mix)",
+    "advice": "Specific clothing, travel, or lifestyle suggestion",
+    "mood_reply": "Short, emotional closing line to make user smile"
+  }}
+]
 
+"""
+    + _EXAMPLES
 )
 
-def _try_generate_with_model(model_name: str, prompt: str) -> Dict[str, Any]:
-    import json
-    temp_model = genai.GenerativeModel(model_name)
-    resp = temp_model.generate_content(prompt)
-    text = resp.text
+# Max cities per batch prompt; larger batches are split into several prompts
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "8"))
+
+# Seconds a request may spend on model calls when the caller passes no deadline
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "12"))
+# A call slower than this percentile of the model's recent latencies is hedged on the next model
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "1").lower() in ("1", "true", "yes")
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+# Bounds on the hedge delay in seconds; the max also applies until a model has enough samples
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "0.3"))
+GEMINI_HEDGE_MAX_DELAY = float(os.getenv("GEMINI_HEDGE_MAX_DELAY", "4"))
+GEMINI_WORKERS = int(os.getenv("GEMINI_WORKERS", "16"))
+
+_executor = ThreadPoolExecutor(max_workers=GEMINI_WORKERS, thread_name_prefix="gemini")
+# Set once a call's result is no longer wanted (hedge lost, deadline passed)
+_abandon: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("gemini_abandon", default=None)
+
+BATCH_CITY_LINE = 'id={id} | City: {city} | Temperature: {temp}°C | Humidity: {humidity}% | Weather Condition: {condition} | Chance of Rain: {rain_chance}% | User’s Query: "{user_query}"'
+
+
+def _unconfigured_reply(city: str, temp: float, humidity: float, condition: str) -> Dict[str, Any]:
+    # Fallback deterministic text when Gemini is not configured
+    GEMINI_DETERMINISTIC.labels("unconfigured").inc()
+    return {
+        "english": f"In {city}, it's {condition.lower()} around {round(temp)}°C with {round(humidity)}% humidity. Carry an umbrella if needed.",
+        "tamil": f"{city} நகரத்தில் இன்று {round(temp)}°C; {condition} நிலை. தேவையெனில் குடை எடுத்துச் செல்லவும்.",
+        "advice": "Wear light, breathable clothes; stay hydrated.",
+        "mood_reply": "Stay positive and enjoy your day!"
+    }
+
+
+def _fallback_text(city: str, temp: float, humidity: float, condition: str) -> Dict[str, Any]:
+    return {
+        "english": f"In {city}, it's {condition.lower()} around {round(temp)}°C with {round(humidity)}% humidity.",
+        "tamil": f"{city} நகரத்தில் {round(temp)}°C; {condition}.",
+        "advice": "Carry water and wear comfortable clothing.",
+        "mood_reply": "Wishing you a wonderful day!"
+    }
+
+
+def _fallback_reply(city: str, temp: float, humidity: float, condition: str, reason: str = "all_models_failed") -> Dict[str, Any]:
+    # Deterministic text when every model failed
+    GEMINI_DETERMINISTIC.labels(reason).inc()
+    return _fallback_text(city, temp, humidity, condition)
+
+
+def is_fallback_reply(reply: Dict[str, Any], city: str, temp: float, humidity: float, condition: str) -> bool:
+    """True if `reply` is the stand-in text sent when no model answered, rather than a model reply."""
+    return reply == _fallback_text(city, temp, humidity, condition)
+
+
+class DeadlineExceeded(AllModelsFailed):
+    """No model answered before the request deadline."""
+
+
+class _Abandoned(Exception):
+    """The caller stopped waiting before this call reached the model."""
+
+
+def _generate_text(model_name: str, gen_model: Any, prompt: str) -> str:
+    acquire_gemini(model_name)
+    abandon = _abandon.get()
+    if abandon is not None and abandon.is_set():
+        raise _Abandoned()
+    options: Dict[str, Any] = {}
+    deadline = current_deadline()
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise _Abandoned()
+        # A call nobody will wait for must not outlive the request
+        options["request_options"] = {"timeout": remaining}
+    started = time.perf_counter()
+    try:
+        text = gen_model.generate_content(prompt, **options).text
+    except Exception:
+        GEMINI_LATENCY.labels(model_name, "error").observe(time.perf_counter() - started)
+        raise
+    GEMINI_LATENCY.labels(model_name, "ok").observe(time.perf_counter() - started)
+    return text
+
+
+def _hedge_delay(name: str) -> float:
+    p = router.latency_percentile(name, GEMINI_HEDGE_PERCENTILE)
+    if p is None:
+        return GEMINI_HEDGE_MAX_DELAY
+    return min(max(p, GEMINI_HEDGE_MIN_DELAY), GEMINI_HEDGE_MAX_DELAY)
+
+
+def _settle_abandoned(name: str, started: float, fut: Future) -> None:
+    # A late success still tells us how fast the model is; a late failure was our own timeout
+    if fut.cancelled() or fut.exception() is not None:
+        router.release(name)
+    else:
+        router.record_success(name, time.monotonic() - started)
+
+
+def _routed_call(fn: Callable[[str, Any], Any], deadline: Optional[float] = None, hedge: bool = True) -> Any:
+    """Run fn(name, model) on the healthiest model until one succeeds or the deadline passes.
+
+    Like router.call(), but attempts run on worker threads so we can stop
+    waiting. A failure moves on to the next candidate. If the running
+    attempt takes longer than its model's GEMINI_HEDGE_PERCENTILE latency,
+    the next candidate gets the same prompt and the first good answer
+    wins. The other attempt is cancelled if it hasn't started, otherwise
+    abandoned (its timeout is the deadline). Raises DeadlineExceeded or
+    AllModelsFailed.
+    """
+    if deadline is None:
+        deadline = current_deadline() or time.monotonic() + GEMINI_DEADLINE
+    queue = router.candidates()
+    abandon = threading.Event()
+    running: Dict[Future, Tuple[str, float, bool]] = {}
+    hedged = False
+    last_exc: Optional[BaseException] = None
+
+    def launch(is_hedge: bool) -> None:
+        name = queue.pop(0)
+        ctx = contextvars.copy_context()
+        ctx.run(set_deadline, deadline)
+        ctx.run(_abandon.set, abandon)
+        # The model is built on the worker thread, so a slow first SDK import doesn't block this loop
+        running[_executor.submit(ctx.run, attributed, lambda: fn(name, router.get_model(name)))] = (name, time.monotonic(), is_hedge)
+
+    try:
+        if queue:
+            launch(False)
+        while running:
+            now = time.monotonic()
+            if now >= deadline:
+                raise DeadlineExceeded("no model answered before the deadline")
+            timeout = deadline - now
+            hedge_at = None
+            if hedge and GEMINI_HEDGE_ENABLED and not hedged and queue and len(running) == 1:
+                name, started, _ = next(iter(running.values()))
+                hedge_at = started + _hedge_delay(name)
+                timeout = min(timeout, max(0.0, hedge_at - now))
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    hedged = True
+                    GEMINI_HEDGES.labels("fired").inc()
+                    launch(True)
+                continue
+            for fut in done:
+                name, started, is_hedge = running.pop(fut)
+                try:
+                    result = fut.result()
+                except _Abandoned:
+                    router.release(name)
+                    continue
+                except Shed as e:
+                    # Our own admission control, not a model fault
+                    router.release(name)
+                    last_exc = e
+                    if e.service_wide:
+                        for rest in queue:
+                            router.release(rest)
+                        queue.clear()
+                    continue
+                except Exception as e:
+                    router.record_failure(name, e)
+                    last_exc = e
+                    continue
+                router.record_success(name, time.monotonic() - started)
+                if is_hedge:
+                    GEMINI_HEDGES.labels("won").inc()
+                return result
+            if not running and queue:
+                GEMINI_FALLBACK_HOPS.inc()
+                launch(False)
+        raise AllModelsFailed(str(last_exc) if last_exc else "no model available")
+    finally:
+        abandon.set()
+        for rest in queue:
+            router.release(rest)
+        for fut, (name, started, _) in running.items():
+            if fut.cancel():
+                router.release(name)
+            else:
+                fut.add_done_callback(partial(_settle_abandoned, name, started))
+
+
+def _try_generate_with_model(model_name: str, gen_model: Any, prompt: str) -> Dict[str, Any]:
+    return _parse_bilingual(model_name, _generate_text(model_name, gen_model, prompt))
+
+
+def _parse_bilingual(model_name: str, text: str) -> Dict[str, Any]:
+    with GEMINI_PARSE_LATENCY.labels("single").time():
+        return _parse_bilingual_text(model_name, text)
+
+
+def _parse_bilingual_text(model_name: str, text: str) -> Dict[str, Any]:
     start = text.find('{')
     end = text.rfind('}')
     if start != -1 and end != -1:
         text = text[start:end+1]
-    return json.loads(text)
+    result = json.loads(text)
+    if not is_valid_bilingual(result):
+        raise ValueError(f"{model_name} returned an incomplete response")
+    return result
 
 
-def generate_bilingual(city: str, temp: float, humidity: float, condition: str, rain_chance: float, user_query: str) -> Dict:
+def generate_bilingual(city: str, temp: float, humidity: float, condition: str, rain_chance: float, user_query: str,
+                       deadline: Optional[float] = None) -> Dict:
+    """Bilingual reply from cache or the models; the fallback text if nothing answers by `deadline` (time.monotonic())."""
     prompt = PROMPT_TEMPLATE.format(city=city, temp=temp, humidity=humidity, condition=condition, rain_chance=rain_chance, user_query=user_query)
-    if model is None:
-        # Fallback deterministic text when Gemini is not configured
-        return {
-            "english": f"In {city}, it's {condition.lower()} around {round(temp)}°C with {round(humidity)}% humidity. Carry an umbrella if needed.",
-            "tamil": f"{city} நகரத்தில் இன்று {round(temp)}°C; {condition} நிலை. தேவையெனில் குடை எடுத்துச் செல்லவும்.",
-            "advice": "Wear light, breathable clothes; stay hydrated.",
-            "mood_reply": "Stay positive and enjoy your day!"
-        }
-    # Try preferred model first, then fallbacks
-    try_order = [GEMINI_MODEL] + [m for m in FALLBACK_MODELS if m != GEMINI_MODEL]
-    for mname in try_order:
+    if not GEMINI_CONFIGURED:
+        return _unconfigured_reply(city, temp, humidity, condition)
+    key = response_key(city, temp, humidity, condition, rain_chance, user_query)
+    cached = get_cached_response(key)
+    if cached is not None:
+        return cached
+    try:
+        result = _routed_call(lambda mname, gen_model: _try_generate_with_model(mname, gen_model, prompt), deadline)
+    except DeadlineExceeded:
+        return _fallback_reply(city, temp, humidity, condition, reason="deadline")
+    except AllModelsFailed:
+        result = None
+    if result is not None:
+        store_response(key, result)
+        return result
+    # If all models failed, return deterministic fallback
+    return _fallback_reply(city, temp, humidity, condition)
+
+
+def _try_generate_batch_with_model(model_name: str, gen_model: Any, prompt: str, items: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """Parse a batch reply into {item index: bilingual}; invalid entries are dropped."""
+    text = _generate_text(model_name, gen_model, prompt)
+    with GEMINI_PARSE_LATENCY.labels("batch").time():
+        return _parse_batch(model_name, text, items)
+
+
+def _parse_batch(model_name: str, text: str, items: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    start = text.find('[')
+    end = text.rfind(']')
+    if start != -1 and end != -1:
+        text = text[start:end+1]
+    entries = json.loads(text)
+    if not isinstance(entries, list):
+        raise ValueError(f"{model_name} did not return a JSON array")
+    by_city = {str(it["city"]).strip().casefold(): i for i, it in enumerate(items)}
+    out: Dict[int, Dict[str, Any]] = {}
+    for entry in entries:
+        if not is_valid_bilingual(entry):
+            continue
+        idx = entry.get("id")
+        if not (isinstance(idx, int) and 0 <= idx < len(items)):
+            # Fall back to matching on the city name the model echoed back
+            idx = by_city.get(str(entry.get("city", "")).strip().casefold())
+        if idx is not None and idx not in out:
+            out[idx] = {f: entry[f] for f in ("english", "tamil", "advice", "mood_reply")}
+    if not out:
+        raise ValueError(f"{model_name} returned no usable batch entries")
+    return out
+
+
+def cached_or_fallback_bilingual(city: str, temp: float, humidity: float, condition: str, rain_chance: float, user_query: str) -> Dict:
+    """Best reply available without calling a model: cached if possible, else the fallback text."""
+    if GEMINI_CONFIGURED:
+        cached = get_cached_response(response_key(city, temp, humidity, condition, rain_chance, user_query))
+        if cached is not None:
+            return cached
+        return _fallback_reply(city, temp, humidity, condition, reason="degraded")
+    return _unconfigured_reply(city, temp, humidity, condition)
+
+
+def generate_bilingual_batch(items: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[Dict]:
+    """Generate bilingual text for several cities with as few prompts as possible.
+
+    Each item has the generate_bilingual() arguments as keys. Cached answers
+    are served first. The rest go out in prompts of up to GEMINI_BATCH_SIZE
+    cities. Entries missing from a malformed or partial reply are retried
+    one by one through generate_bilingual(). Results are in input order.
+    """
+    if deadline is None:
+        deadline = current_deadline() or time.monotonic() + GEMINI_DEADLINE
+
+    def single(it: Dict[str, Any]) -> Dict:
+        return generate_bilingual(it["city"], it["temp"], it["humidity"], it["condition"], it.get("rain_chance", 0.0), it["user_query"], deadline)
+
+    if not GEMINI_CONFIGURED or len(items) <= 1:
+        return [single(it) for it in items]
+
+    results: List[Optional[Dict]] = [None] * len(items)
+    # Identical requests share one slot in the prompt
+    pending: Dict[str, List[int]] = {}
+    for i, it in enumerate(items):
+        key = response_key(it["city"], it["temp"], it["humidity"], it["condition"], it.get("rain_chance", 0.0), it["user_query"])
+        cached = get_cached_response(key)
+        if cached is not None:
+            results[i] = cached
+        else:
+            pending.setdefault(key, []).append(i)
+
+    keys = list(pending)
+    for off in range(0, len(keys), max(1, GEMINI_BATCH_SIZE)):
+        chunk = keys[off:off + GEMINI_BATCH_SIZE]
+        if len(chunk) < 2:
+            continue
+        chunk_items = [items[pending[k][0]] for k in chunk]
+        lines = "\n".join(
+            BATCH_CITY_LINE.format(id=j, city=it["city"], temp=it["temp"], humidity=it["humidity"], condition=it["condition"], rain_chance=it.get("rain_chance", 0.0), user_query=it["user_query"])
+            for j, it in enumerate(chunk_items)
+        )
+        prompt = BATCH_PROMPT_TEMPLATE.format(city_lines=lines)
         try:
-            return _try_generate_with_model(mname, prompt)
-        except Exception as e:
-            # If model not found/unsupported, try next; otherwise continue
-            msg = str(e).lower()
-            if ("not found" in msg) or ("404" in msg) or ("unsupported" in msg):
-                continue
-            # For rate limits/transient errors, we also try next model
+            # Batch prompts are long; hedging them would double the token spend
+            parsed = _routed_call(lambda mname, gen_model: _try_generate_batch_with_model(mname, gen_model, prompt, chunk_items), deadline, hedge=False)
+        except AllModelsFailed:
             continue
-    # If all models failed, return deterministic fallback
-    return {
-        "english": f"In {city}, it's {condition.lower()} around {round(temp)}°C with {round(humidity)}% humidity.",
-        "tamil": f"{city} நகரத்தில் {round(temp)}°C; {condition}.",
-        "advice": "Carry water and wear comfortable clothing.",
-        "mood_reply": "Wishing you a wonderful day!"
-    }
+        for j, bilingual in parsed.items():
+            store_response(chunk[j], bilingual)
+            for i in pending[chunk[j]]:
+                results[i] = bilingual
+
+    # Anything the batch didn't cover goes through the single-city path
+    for i, r in enumerate(results):
+        if r is None:
+            results[i] = single(items[i])
+    return results  # type: ignore[return-value]
+
+
+def _partial_field(text: str, field: str) -> str:
+    """Decode as much of a JSON string field as has arrived so far."""
+    m = re.search(r'"%s"\s*:\s*"((?:[^"\\]|\\.)*)' % re.escape(field), text)
+    if not m:
+        return ""
+    # Drop a \uXXXX escape that is still being written
+    raw = re.sub(r'\\u[0-9a-fA-F]{0,3}$', "", m.group(1))
+    try:
+        return json.loads('"' + raw + '"')
+    except ValueError:
+        return ""
+
+
+def stream_bilingual(city: str, temp: float, humidity: float, condition: str, rain_chance: float, user_query: str,
+                     field: str = "english", deadline: Optional[float] = None) -> Iterator[Tuple[str, Any]]:
+    """Stream a reply as ("delta", text) events followed by one ("done", bilingual).
+
+    Deltas carry the newly decoded part of `field` while the model is still
+    writing. The final event always has the complete, validated Bilingual
+    dict, which may be a cached or fallback reply. If no model has finished
+    by `deadline` (time.monotonic()), "done" carries the fallback text.
+    """
+    def whole(reply: Dict[str, Any]) -> Iterator[Tuple[str, Any]]:
+        yield "delta", reply.get(field, "")
+        yield "done", reply
+
+    if not GEMINI_CONFIGURED:
+        yield from whole(_unconfigured_reply(city, temp, humidity, condition))
+        return
+    key = response_key(city, temp, humidity, condition, rain_chance, user_query)
+    cached = get_cached_response(key)
+    if cached is not None:
+        yield from whole(cached)
+        return
+
+    if deadline is None:
+        deadline = current_deadline() or time.monotonic() + GEMINI_DEADLINE
+    prompt = PROMPT_TEMPLATE.format(city=city, temp=temp, humidity=humidity, condition=condition, rain_chance=rain_chance, user_query=user_query)
+    names = router.candidates()
+    sent = ""
+    reason = "all_models_failed"
+    result = None
+    # Candidates recorded or released; the finally releases the rest, also when the client disconnects mid-stream
+    settled: set = set()
+    try:
+        for i, mname in enumerate(names):
+            if i > 0:
+                GEMINI_FALLBACK_HOPS.inc()
+            try:
+                acquire_gemini(mname, deadline=deadline)
+            except Shed as e:
+                router.release(mname)
+                settled.add(mname)
+                if e.service_wide:
+                    break
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                reason = "deadline"
+                break
+            started = time.perf_counter()
+            text = ""
+            outcome = "error"
+            try:
+                for chunk in router.get_model(mname).generate_content(prompt, stream=True, request_options={"timeout": remaining}):
+                    if time.monotonic() >= deadline:
+                        raise DeadlineExceeded("stream did not finish before the deadline")
+                    text += getattr(chunk, "text", "") or ""
+                    decoded = _partial_field(text, field)
+                    if len(decoded) > len(sent) and decoded.startswith(sent):
+                        yield "delta", decoded[len(sent):]
+                        sent = decoded
+                outcome = "ok"
+                GEMINI_LATENCY.labels(mname, outcome).observe(time.perf_counter() - started)
+                result = _parse_bilingual(mname, text)
+            except DeadlineExceeded:
+                GEMINI_LATENCY.labels(mname, "error").observe(time.perf_counter() - started)
+                reason = "deadline"
+                break
+            except Exception as e:
+                if outcome == "error":
+                    GEMINI_LATENCY.labels(mname, outcome).observe(time.perf_counter() - started)
+                router.record_failure(mname, e)
+                settled.add(mname)
+                if time.monotonic() >= deadline:
+                    # Most likely the SDK timeout we set; no time left for another model
+                    reason = "deadline"
+                    break
+                if sent:
+                    # Text already reached the client; don't restart on another model
+                    break
+                continue
+            router.record_success(mname, time.perf_counter() - started)
+            settled.add(mname)
+            break
+    finally:
+        for rest in names:
+            if rest not in settled:
+                router.release(rest)
+    if result is not None:
+        store_response(key, result)
+        yield "done", result
+        return
+    reply = _fallback_reply(city, temp, humidity, condition, reason=reason)
+    if not sent:
+        yield "delta", reply.get(field, "")
+    yield "done", reply
 
 
 def check_gemini_key() -> Dict[str, Any]:
     """Verify Gemini API key configuration and basic reachability.
     Returns a dict: {configured, reachable, message, model}
     """
-    configured = bool(GEMINI_KEY) and GENAI_AVAILABLE
-    if not configured:
+    if not GEMINI_CONFIGURED:
         return {"configured": False, "reachable": False, "message": "google-generativeai not available or GEMINI_API_KEY not set", "model": None}
+
+    def probe(mname: str, gen_model: Any) -> Dict[str, Any]:
+        # Use a tiny request
+        try:
+            _ = gen_model.count_tokens("ping")  # type: ignore[attr-defined]
+            return {"configured": True, "reachable": True, "message": "count_tokens ok", "model": mname}
+        except Exception:
+            resp = gen_model.generate_content("ok")
+            if getattr(resp, 'text', None):
+                return {"configured": True, "reachable": True, "message": "generate_content ok", "model": mname}
+            raise ValueError(f"{mname} returned an empty response")
+
     try:
-        # Try preferred then fallbacks
-        for mname in [GEMINI_MODEL] + [m for m in FALLBACK_MODELS if m != GEMINI_MODEL]:
-            try:
-                temp_model = genai.GenerativeModel(mname)
-                # Use a tiny request
-                try:
-                    _ = temp_model.count_tokens("ping")  # type: ignore[attr-defined]
-                    return {"configured": True, "reachable": True, "message": "count_tokens ok", "model": mname}
-                except Exception:
-                    resp = temp_model.generate_content("ok")
-                    if getattr(resp, 'text', None):
-                        return {"configured": True, "reachable": True, "message": "generate_content ok", "model": mname}
-            except Exception as e:
-                # Try next model if not found/unsupported
-                msg = str(e).lower()
-                if ("not found" in msg) or ("404" in msg) or ("unsupported" in msg):
-                    continue
-                continue
+        # Healthiest model first; open circuits are skipped
+        return router.call(probe)
+    except AllModelsFailed:
         return {"configured": True, "reachable": False, "message": "No supported Gemini model reachable", "model": GEMINI_MODEL}
     except Exception as e:
         return {"configured": True, "reachable": False, "message": str(e), "model": GEMINI_MODEL}
 
 
+def model_router_state() -> list[dict[str, Any]]:
+    """Circuit state, error rate and latency for every routed model."""
+    return router.snapshot()
+
+
+def hedge_state() -> Dict[str, int]:
+    """How many hedges fired and how many of them beat the primary."""
+    # The metric's children are lock-guarded, and hedges are counted from several worker threads
+    return {result: int(GEMINI_HEDGES.labels(result).value) for result in ("fired", "won")}
+
+
 def list_gemini_models() -> list[dict[str, Any]]:
     """Return available model IDs and whether they support generateContent."""
-    if not (GENAI_AVAILABLE and GEMINI_KEY):
+    if not GEMINI_CONFIGURED:
         return []
     try:
         models = []
-        for m in genai.list_models():
+        for m in _sdk().list_models():
             # Some SDKs expose attributes slightly differently; be defensive
             name = getattr(m, 'name', None) or getattr(m, 'model', None) or str(m)
             methods = set(getattr(m, 'supported_generation_methods', []) or [])
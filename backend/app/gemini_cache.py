@@ -0,0 +1,98 @@
+import os
+import re
+import json
+import math
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from .cache import TTLCache, normalize_key
+from .database import SessionLocal
+from .models import LLMResponseCache
+from .metrics import register_cache
+from .shared import make_backend
+
+# Bucket widths: readings inside one bucket share a cached answer
+GEMINI_CACHE_TEMP_BUCKET = float(os.getenv("GEMINI_CACHE_TEMP_BUCKET", "1.0"))
+GEMINI_CACHE_HUMIDITY_BUCKET = float(os.getenv("GEMINI_CACHE_HUMIDITY_BUCKET", "5.0"))
+GEMINI_CACHE_RAIN_BUCKET = float(os.getenv("GEMINI_CACHE_RAIN_BUCKET", "10.0"))
+
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "1800"))
+GEMINI_CACHE_SIZE = int(os.getenv("GEMINI_CACHE_SIZE", "1024"))
+# Also keep entries in the SQLAlchemy DB so they survive restarts
+GEMINI_CACHE_PERSIST = os.getenv("GEMINI_CACHE_PERSIST", "0").lower() in ("1", "true", "yes")
+
+response_cache = TTLCache(maxsize=GEMINI_CACHE_SIZE, ttl=GEMINI_CACHE_TTL, backend=make_backend("gemini", GEMINI_CACHE_SIZE))
+register_cache("gemini", response_cache)
+
+_PUNCT = re.compile(r"[^\w\s]", re.UNICODE)
+BILINGUAL_FIELDS = ("english", "tamil", "advice", "mood_reply")
+
+
+def _bucket(value: float, width: float) -> float:
+    if width <= 0:
+        return float(value)
+    return math.floor(float(value) / width) * width
+
+
+def normalize_query(text: str) -> str:
+    return normalize_key(_PUNCT.sub(" ", text or ""))
+
+
+def response_key(city: str, temp: float, humidity: float, condition: str, rain_chance: float, user_query: str) -> str:
+    parts = [
+        normalize_key(city),
+        f"{_bucket(temp, GEMINI_CACHE_TEMP_BUCKET):g}",
+        f"{_bucket(humidity, GEMINI_CACHE_HUMIDITY_BUCKET):g}",
+        normalize_key(condition),
+        f"{_bucket(rain_chance or 0.0, GEMINI_CACHE_RAIN_BUCKET):g}",
+        normalize_query(user_query),
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def is_valid_bilingual(data: Any) -> bool:
+    return isinstance(data, dict) and all(isinstance(data.get(f), str) and data.get(f) for f in BILINGUAL_FIELDS)
+
+
+def get_cached_response(key: str) -> Optional[Dict[str, Any]]:
+    cached = response_cache.get(key)
+    if cached is not None or not GEMINI_CACHE_PERSIST:
+        return cached
+    try:
+        with SessionLocal() as db:
+            row = db.get(LLMResponseCache, key)
+            if row is None:
+                return None
+            age = datetime.utcnow() - row.created_at
+            if age > timedelta(seconds=GEMINI_CACHE_TTL):
+                db.delete(row)
+                db.commit()
+                return None
+            data = json.loads(row.payload)
+    except Exception:
+        return None
+    # Promote into memory for the rest of its lifetime
+    response_cache.set(key, data, ttl=GEMINI_CACHE_TTL - age.total_seconds())
+    return data
+
+
+def store_response(key: str, data: Dict[str, Any]) -> None:
+    """Cache a successful model output. Fallback dicts must never reach here."""
+    if not is_valid_bilingual(data):
+        return
+    data = {f: data[f] for f in BILINGUAL_FIELDS}
+    response_cache.set(key, data)
+    if not GEMINI_CACHE_PERSIST:
+        return
+    try:
+        with SessionLocal() as db:
+            db.merge(LLMResponseCache(key=key, payload=json.dumps(data, ensure_ascii=False), created_at=datetime.utcnow()))
+            db.commit()
+    except Exception:
+        # Persistence is best-effort; the memory tier already has the entry
+        pass
+
+
+def gemini_cache_stats() -> Dict[str, Any]:
+    return response_cache.stats()
@@ -1,23 +1,113 @@
 import os
-from fastapi import FastAPI, Depends
+import json
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool, iterate_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from dotenv import load_dotenv
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
 
-from .database import Base, engine, get_db
-from .models import Query, WeatherLog, UserPreference
+from .database import async_engine, get_db, init_schema
+from .startup import startup
 from .schemas import (
     WeatherIn, WeatherOut, VoiceIn, RouteIn, RouteOut, MoodIn, MoodOut, 
     Bilingual, KeysOut, GeminiModelsOut, ChatIn, ChatOut, CitiesOut, 
-    PreferenceIn, PreferenceOut
+    PreferenceIn, PreferenceOut, PreferenceBulkIn, PreferenceBulkOut, CacheStatsOut, WriterStatsOut, WarmerStatusOut, NowcastOut,
+    RateLimitStatsOut, WeatherBatchIn, WeatherBatchOut, HistoryOut, RetentionStatusOut, StartupOut,
+    ProfilerIn, ProfilerStatusOut,
 )
-from .weather import fetch_weather, shape_basic_weather, check_openweather_key
-from .gemini import generate_bilingual, check_gemini_key, list_gemini_models
+from .weather import (
+    fetch_weather_async, shape_basic_weather, check_openweather_key,
+    fallback_weather, afallback_weather, log_observation,
+    weather_cache, weather_cache_stats, get_async_client, close_async_client,
+)
+from .gemini import generate_bilingual, generate_bilingual_batch, stream_bilingual, cached_or_fallback_bilingual, is_fallback_reply, check_gemini_key, list_gemini_models, model_router_state, hedge_state, warm_gemini
+from .gemini_cache import gemini_cache_stats, normalize_query
+from . import preferences
+from .preferences import preference_cache_stats
+from .writer import write_behind, alog_query
+from .warmer import WeatherWarmer
+from .nowcast import nowcaster
+from .rollups import retention, history_points, period_models, rollup_city, bucket_start
+from .ratelimit import INTERACTIVE, BATCH, set_priority, set_deadline, limiter
+from .cache import normalize_key
+from .cities import TN_CITIES, city_matcher
+from .metrics import REGISTRY, MetricsMiddleware
+from .httpcache import CompressionMiddleware, make_etag, not_modified, cache_headers
+from .profiler import ProfilerMiddleware, AttributedIterator, attributed, profiler, require_profile_token
+
+# uvicorn configures this logger, so the startup report shows up without extra logging setup
+logger = logging.getLogger("uvicorn.error")
+
+# Route replies carry model text for every city, so keep them short; /api/weather/batch is for long lists
+ROUTE_MAX_CITIES = int(os.getenv("ROUTE_MAX_CITIES", "8"))
+ROUTE_CONCURRENCY = int(os.getenv("ROUTE_CONCURRENCY", "4"))
+# Seconds /api/route/stream waits before answering the rest from cached/fallback data
+ROUTE_STREAM_DEADLINE = float(os.getenv("ROUTE_STREAM_DEADLINE", "10"))
+# Seconds /api/weather waits on OWM before answering from the nowcast
+WEATHER_FETCH_BUDGET = float(os.getenv("WEATHER_FETCH_BUDGET", "4"))
+# End-to-end budgets; model calls still running at the deadline give way to the fallback text
+INTERACTIVE_DEADLINE = float(os.getenv("INTERACTIVE_DEADLINE", "10"))
+ROUTE_DEADLINE = float(os.getenv("ROUTE_DEADLINE", "20"))
+# Distinct cities per /api/weather/batch request, and OWM fetches it runs at once
+WEATHER_BATCH_MAX_CITIES = int(os.getenv("WEATHER_BATCH_MAX_CITIES", "500"))
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", "16"))
+# Default window for /api/history when `since` isn't given
+HISTORY_DEFAULT_HOURS = int(os.getenv("HISTORY_DEFAULT_HOURS", "48"))
+HISTORY_DEFAULT_DAYS = int(os.getenv("HISTORY_DEFAULT_DAYS", "30"))
+# Browser cache lifetime for GET /api/cities
+CITIES_MAX_AGE = int(os.getenv("CITIES_MAX_AGE", "3600"))
+
+
+async def _warm(name: str, fn) -> None:
+    try:
+        await fn()
+    except Exception as e:
+        logger.warning("warming %s failed: %s", name, e)
+
 
-load_dotenv()
+async def _warm_http() -> None:
+    with startup.phase("http"):
+        await get_async_client()
 
-app = FastAPI(title="AI-Based Weather Prediction and Voice Assistant — Tamil Nadu")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Tables must exist before the first request; SDK and HTTP clients warm in the background
+    with startup.phase("db"):
+        await run_in_threadpool(init_schema)
+    warm = [
+        asyncio.create_task(_warm("gemini", lambda: run_in_threadpool(warm_gemini))),
+        asyncio.create_task(_warm("http", _warm_http)),
+    ]
+    write_behind.start()
+    warmer.start()
+    nowcaster.start()
+    retention.start()
+    startup.since_start("ready")
+    logger.info("startup timings (ms): %s", startup.report()["phases_ms"])
+    yield
+    for t in warm:
+        t.cancel()
+    await retention.stop()
+    await nowcaster.stop()
+    await warmer.stop()
+    await close_async_client()
+    # Drain buffered Query/WeatherLog rows before the process exits
+    await run_in_threadpool(write_behind.stop)
+    await async_engine.dispose()
+
+
+app = FastAPI(title="AI-Based Weather Prediction and Voice Assistant — Tamil Nadu", lifespan=lifespan)
+
+# Innermost, so profiles cover the handler rather than CORS/gzip/metrics
+app.add_middleware(ProfilerMiddleware)
 
 # For direct access if needed (dev). The Next.js dev proxy makes this optional.
 app.add_middleware(
@@ -27,71 +117,261 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+# Refreshes TN_CITIES in the background so dashboard requests rarely hit OWM
+warmer = WeatherWarmer(TN_CITIES)
+CITIES_ETAG = make_etag(TN_CITIES)
 
-# Create tables
-Base.metadata.create_all(bind=engine)
 
-TN_CITIES = [
-    "Chennai", "Coimbatore", "Madurai", "Tiruchirappalli", "Salem", "Tirunelveli", "Erode", "Vellore", "Thoothukudi", "Tiruppur",
-    "Dindigul", "Thanjavur", "Kanchipuram", "Nagercoil", "Karur", "Cuddalore", "Nagapattinam", "Pudukkottai", "Sivagangai",
-]
+async def current_weather(city: str):
+    """Shaped weather from the warmer's snapshot, else a (cached) fetch."""
+    return warmer.get(city) or shape_basic_weather(await fetch_weather_async(city))
 
 @app.get("/api/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 # Convenience aliases to avoid 404s when hitting root paths during development
 @app.get("/")
-def root():
+async def root():
     return {"message": "FastAPI backend running. Try GET /api/health, POST /api/weather, /api/voice, /api/route, /api/mood"}
 
 @app.get("/health")
-def health_alias():
-    return health()
+async def health_alias():
+    return await health()
 
-@app.post("/api/weather", response_model=WeatherOut)
-def api_weather(payload: WeatherIn, db: Session = Depends(get_db)):
-    raw = fetch_weather(payload.city)
-    shaped = shape_basic_weather(raw)
-    bilingual = generate_bilingual(
-        shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"], shaped.get("rain_chance", 0.0), payload.user_query or f"Weather in {payload.city}"
-    )
-    # store logs
-    q = Query(city=shaped["city"], query_text=payload.user_query or "weather", response_text=bilingual.get("english", ""))
-    db.add(q)
-    db.add(WeatherLog(city=shaped["city"], temp=shaped["temp"], humidity=shaped["humidity"], condition=shaped["condition"]))
-    db.commit()
 
+def start_deadline(seconds: float) -> float:
+    """Deadline (time.monotonic()) for the current request, also seen by the rate limiter."""
+    deadline = time.monotonic() + seconds
+    set_deadline(deadline)
+    return deadline
+
+async def weather_or_nowcast(city: str):
+    """current_weather() within WEATHER_FETCH_BUDGET, else the best local estimate."""
+    try:
+        # The cache runs the upstream load as its own task, so timing out here doesn't cancel it
+        # for concurrent requests for the same city, and the reading still lands in the cache
+        return await asyncio.wait_for(current_weather(city), WEATHER_FETCH_BUDGET)
+    except Exception:
+        return shape_basic_weather(await afallback_weather(city))
+
+async def weather_reply(shaped: dict, user_query: Optional[str], city: str, deadline: float):
+    # The Gemini SDK is blocking, so model calls run in the threadpool
+    bilingual = await run_in_threadpool(
+        attributed, generate_bilingual, shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"], shaped.get("rain_chance", 0.0), user_query or f"Weather in {city}", deadline
+    )
+    # store logs (write-behind; flushed in bulk off the request path)
+    # The observation itself was logged when it was fetched, not per request
+    await alog_query(shaped["city"], user_query or "weather", bilingual.get("english", ""))
     return {**shaped, "bilingual": bilingual}
 
+@app.post("/api/weather", response_model=WeatherOut)
+async def api_weather(payload: WeatherIn):
+    set_priority(INTERACTIVE)
+    deadline = start_deadline(INTERACTIVE_DEADLINE)
+    shaped = await weather_or_nowcast(payload.city)
+    return await weather_reply(shaped, payload.user_query, payload.city, deadline)
+
+@app.get("/api/weather/{city}", response_model=WeatherOut)
+async def api_weather_get(city: str, request: Request, response: Response, q: Optional[str] = None):
+    """Cacheable form of POST /api/weather for dashboard polling.
+
+    The ETag covers the observation and the query, so a poll that sends
+    If-None-Match gets a 304 without any model work until OWM reports a
+    new reading. max-age is what is left of the weather cache entry.
+    A fallback reply (no model answered) is sent no-cache without
+    validators, so the next poll asks the models again.
+    """
+    set_priority(INTERACTIVE)
+    deadline = start_deadline(INTERACTIVE_DEADLINE)
+    shaped = await weather_or_nowcast(city)
+    etag = make_etag(shaped, normalize_query(q or city))
+    # Nowcast/stub readings can be replaced by a real one at any moment
+    max_age = 0 if shaped.get("source") else await weather_cache.attl_remaining(normalize_key(city))
+    headers = cache_headers(etag, shaped.get("observed_at"), max_age)
+    if not_modified(request, etag, shaped.get("observed_at")):
+        return Response(status_code=304, headers=headers)
+    data = await weather_reply(shaped, q, city, deadline)
+    if is_fallback_reply(data["bilingual"], shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"]):
+        headers = {"Cache-Control": "no-cache"}
+    response.headers.update(headers)
+    return data
+
 @app.post("/api/voice")
-def api_voice(payload: VoiceIn, db: Session = Depends(get_db)):
-    # Extract city from transcript - match longest city name first to avoid false matches
-    transcript = payload.transcript.lower()
-    city = "Chennai"  # default
-    
-    # Sort cities by length (longest first) to match specific cities before shorter ones
-    sorted_cities = sorted(TN_CITIES, key=len, reverse=True)
-    for c in sorted_cities:
-        if c.lower() in transcript:
-            city = c
-            break
-    
-    data = api_weather(WeatherIn(city=city, user_query=payload.transcript), db)  # type: ignore
-    return {"bilingual": data["bilingual"], "city": city}
+async def api_voice(payload: VoiceIn):
+    # Extract city from transcript: word-boundary match over names, Tamil spellings and aliases
+    match = city_matcher.match(payload.transcript)
+    city = match["city"] if match else "Chennai"  # default
+
+    data = await api_weather(WeatherIn(city=city, user_query=payload.transcript))
+    return {"bilingual": data["bilingual"], "city": city, "confidence": match["confidence"] if match else 0.0}
 
 @app.post("/api/route", response_model=RouteOut)
-def api_route(payload: RouteIn, db: Session = Depends(get_db)):
-    results: List[WeatherOut] = []
-    for c in payload.cities[:8]:  # limit to 8 cities to keep it quick
-        raw = fetch_weather(c)
-        shaped = shape_basic_weather(raw)
-        bilingual = generate_bilingual(shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"], shaped.get("rain_chance", 0.0), f"Route planner for {c}")
-        results.append({**shaped, "bilingual": bilingual})  # type: ignore
+async def api_route(payload: RouteIn):
+    set_priority(BATCH)
+    deadline = start_deadline(payload.deadline if payload.deadline and payload.deadline > 0 else ROUTE_DEADLINE)
+    sem = asyncio.Semaphore(ROUTE_CONCURRENCY)
+
+    async def one(c: str):
+        async with sem:
+            try:
+                return await current_weather(c)
+            except Exception:
+                # OWM failed or the request was shed: one bad city shouldn't fail the route
+                return shape_basic_weather(await afallback_weather(c))
+
+    cities = payload.cities[:ROUTE_MAX_CITIES]
+    # gather preserves input order
+    shaped_list = await asyncio.gather(*(one(c) for c in cities))
+    items = [
+        {**{k: s[k] for k in ("city", "temp", "humidity", "condition")}, "rain_chance": s.get("rain_chance", 0.0), "user_query": f"Route planner for {c}"}
+        for c, s in zip(cities, shaped_list)
+    ]
+    # One batched Gemini prompt for the whole route; the SDK is blocking so keep it off the event loop
+    bilinguals = await run_in_threadpool(attributed, generate_bilingual_batch, items, deadline)
+    results: List[WeatherOut] = [{**s, "bilingual": b} for s, b in zip(shaped_list, bilinguals)]  # type: ignore
     return {"results": results}
 
+
+def _degraded_weather(city: str, user_query: str):
+    """Stale snapshot/cache entry (or fallback data) plus a reply that needs no model call."""
+    shaped = warmer.get(city, allow_stale=True)
+    if shaped is None:
+        shaped = shape_basic_weather(fallback_weather(city))
+    bilingual = cached_or_fallback_bilingual(shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"], shaped.get("rain_chance", 0.0), user_query)
+    return {**shaped, "bilingual": bilingual}
+
+
+@app.post("/api/route/stream")
+async def api_route_stream(payload: RouteIn):
+    """NDJSON variant of /api/route: one line per city as soon as it is ready.
+
+    Each line has the city's original `index`, and either `result` (a
+    WeatherOut) or `error`. Cities still pending at the deadline are sent
+    with a degraded result built from cached or fallback data and marked
+    `"stale": true`.
+    """
+    cities = payload.cities[:ROUTE_MAX_CITIES]
+    deadline = payload.deadline if payload.deadline and payload.deadline > 0 else ROUTE_STREAM_DEADLINE
+    sem = asyncio.Semaphore(ROUTE_CONCURRENCY)
+
+    async def one(i: int, c: str, deadline_at: float):
+        try:
+            async with sem:
+                # The OWM load may be shared with other requests for this city; shielded so
+                # cutting this stream off at its deadline leaves it running for them
+                shaped = await asyncio.shield(current_weather(c))
+                bilingual = await run_in_threadpool(
+                    attributed, generate_bilingual, shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"], shaped.get("rain_chance", 0.0), f"Route planner for {c}", deadline_at
+                )
+            result = WeatherOut(**shaped, bilingual=bilingual).model_dump()
+            return {"index": i, "city": c, "result": result, "stale": False}
+        except Exception as e:
+            return {"index": i, "city": c, "error": str(e) or e.__class__.__name__}
+
+    async def lines():
+        set_priority(BATCH)
+        # Calls cut off at the deadline stop on their own instead of finishing in the background
+        deadline_at = start_deadline(deadline)
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        tasks = {asyncio.create_task(one(i, c, deadline_at)): i for i, c in enumerate(cities)}
+        pending = set(tasks)
+        try:
+            while pending:
+                timeout = end - loop.time()
+                if timeout <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    yield json.dumps(t.result(), ensure_ascii=False) + "\n"
+        finally:
+            # Also runs when the client disconnects. This only stops this stream's own waiting:
+            # shared weather loads carry on, and Gemini calls stop at deadline_at
+            for t in pending:
+                t.cancel()
+        for i in sorted(tasks[t] for t in pending):
+            c = cities[i]
+            try:
+                # May read the persisted response cache, so keep it off the event loop
+                result = WeatherOut(**await run_in_threadpool(attributed, _degraded_weather, c, f"Route planner for {c}")).model_dump()
+                record = {"index": i, "city": c, "result": result, "stale": True}
+            except Exception as e:
+                record = {"index": i, "city": c, "error": str(e) or e.__class__.__name__, "stale": True}
+            yield json.dumps(record, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/weather/batch", response_model=WeatherBatchOut)
+async def api_weather_batch(payload: WeatherBatchIn):
+    """Weather for many cities in one call, e.g. for a map layer.
+
+    Names are normalized and aliases resolved ("Trichy", "tiruchirappalli "
+    are one city), so every distinct city is looked up once. Fresh warmer
+    snapshots and weather cache entries are used as-is. The rest are
+    fetched 20 per call by OWM ID where the ID is known, else by name,
+    WEATHER_BATCH_CONCURRENCY at a time. Model text is only generated when
+    `include_text` is set.
+    """
+    set_priority(BATCH)
+    deadline = start_deadline(payload.deadline if payload.deadline and payload.deadline > 0 else ROUTE_DEADLINE)
+
+    # normalized key -> (display name, request names that resolved to it); insertion order = first mention
+    wanted: Dict[str, tuple] = {}
+    for requested in payload.cities:
+        name = city_matcher.canonical(requested) or " ".join(requested.split())
+        if name:
+            wanted.setdefault(normalize_key(name), (name, []))[1].append(requested)
+    if len(wanted) > WEATHER_BATCH_MAX_CITIES:
+        raise HTTPException(status_code=422, detail=f"At most {WEATHER_BATCH_MAX_CITIES} distinct cities per request")
+
+    shaped: Dict[str, dict] = {}
+    for key, (name, _) in wanted.items():
+        hit = warmer.get(name)
+        if hit is None:
+            raw = await weather_cache.aget(key)
+            hit = shape_basic_weather(raw) if raw is not None else None
+        if hit is not None:
+            shaped[key] = hit
+    cached = set(shaped)
+    misses = [name for key, (name, _) in wanted.items() if key not in cached]
+
+    sem = asyncio.Semaphore(WEATHER_BATCH_CONCURRENCY)
+    for name, raw in (await warmer.fetch_known(misses, sem=sem, deadline=deadline)).items():
+        shaped[normalize_key(name)] = shape_basic_weather(raw)
+        await log_observation(raw)
+
+    async def by_name(name: str):
+        async with sem:
+            try:
+                budget = min(WEATHER_FETCH_BUDGET, deadline - time.monotonic())
+                raw = await asyncio.wait_for(fetch_weather_async(name), max(0.0, budget))
+            except Exception:
+                return shape_basic_weather(await afallback_weather(name))
+            warmer.learn_id(name, raw)
+            return shape_basic_weather(raw)
+
+    rest = [name for name in misses if normalize_key(name) not in shaped]
+    for name, s in zip(rest, await asyncio.gather(*(by_name(n) for n in rest))):
+        shaped[normalize_key(name)] = s
+
+    results = [{**shaped[key], "names": names, "cached": key in cached} for key, (_, names) in wanted.items()]
+    if payload.include_text:
+        items = [
+            {**{k: r[k] for k in ("city", "temp", "humidity", "condition")}, "rain_chance": r.get("rain_chance", 0.0), "user_query": f"Weather in {r['city']}"}
+            for r in results
+        ]
+        bilinguals = await run_in_threadpool(attributed, generate_bilingual_batch, items, deadline)
+        for r, b in zip(results, bilinguals):
+            r["bilingual"] = b
+    return {"results": results, "requested": len(payload.cities), "unique": len(results), "fetched": len(misses)}
+
+
 @app.post("/api/mood", response_model=MoodOut)
-def api_mood(payload: MoodIn):
+async def api_mood(payload: MoodIn):
     text = payload.text
     # simple heuristic: punctuation + keywords => cheerful vs calm vs formal
     exclam = text.count("!")
@@ -103,27 +383,134 @@ def api_mood(payload: MoodIn):
 
 
 @app.get("/api/keys", response_model=KeysOut)
-def api_keys():
-    owm = check_openweather_key()
-    gem = check_gemini_key()
+async def api_keys():
+    owm, gem = await asyncio.gather(check_openweather_key(), run_in_threadpool(check_gemini_key))
     return {"openweathermap": owm, "gemini": gem}
 
 
 @app.get("/api/gemini/models", response_model=GeminiModelsOut)
-def api_gemini_models():
-    models = list_gemini_models()
-    return {"models": models}
+async def api_gemini_models():
+    models = await run_in_threadpool(list_gemini_models)
+    return {"models": models, "router": model_router_state(), "hedges": hedge_state()}
+
+
+@app.get("/api/cache/stats", response_model=CacheStatsOut)
+async def api_cache_stats():
+    """Hit/miss/coalesced counters for the in-process caches"""
+    # Sizes may come from the shared SQLite store
+    return await run_in_threadpool(lambda: {"weather": weather_cache_stats(), "gemini": gemini_cache_stats(), "preferences": preference_cache_stats()})
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of request, upstream, cache and DB metrics"""
+    # Cache and bucket collectors may read the shared SQLite store
+    return PlainTextResponse(await run_in_threadpool(REGISTRY.render), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/profiler", response_model=ProfilerStatusOut, dependencies=[Depends(require_profile_token)])
+async def api_profiler_status():
+    """Sampling rate, time left and profiled requests held per route"""
+    return profiler.status()
+
+
+@app.post("/api/profiler", response_model=ProfilerStatusOut, dependencies=[Depends(require_profile_token)])
+async def api_profiler_configure(payload: ProfilerIn):
+    """Profile `rate` of requests (optionally only under `routes` prefixes) for `duration` seconds; rate 0 stops"""
+    profiler.configure(payload.rate, payload.duration, payload.routes)
+    return profiler.status()
+
+
+@app.get("/api/profiler/stacks", dependencies=[Depends(require_profile_token)])
+async def api_profiler_stacks(route: Optional[str] = None):
+    """Collapsed stacks of the profiled requests in the ring (flamegraph.pl / speedscope input)"""
+    return PlainTextResponse(profiler.collapsed(route))
+
+
+@app.delete("/api/profiler/stacks", response_model=ProfilerStatusOut, dependencies=[Depends(require_profile_token)])
+async def api_profiler_clear():
+    profiler.clear()
+    return profiler.status()
+
+
+@app.get("/api/writer/stats", response_model=WriterStatsOut)
+async def api_writer_stats():
+    """Buffer depth and write/drop counters for the write-behind logger"""
+    return write_behind.stats()
+
+
+@app.get("/api/ratelimit/stats", response_model=RateLimitStatsOut)
+async def api_ratelimit_stats():
+    """Tokens, queue depth by priority, waits and sheds for each upstream bucket"""
+    return {"buckets": await run_in_threadpool(limiter.stats)}
+
+
+@app.get("/api/warmer/status", response_model=WarmerStatusOut)
+async def api_warmer_status():
+    """Last refresh time/duration and freshness of the TN_CITIES snapshot"""
+    return warmer.status()
+
+
+@app.get("/api/nowcast", response_model=NowcastOut)
+async def api_nowcast():
+    """Local short-horizon estimates for every city with enough WeatherLog history"""
+    return {"status": nowcaster.status(), "predictions": nowcaster.predict_all()}
+
+
+def _naive_utc(d: Optional[datetime]) -> Optional[datetime]:
+    # Rollup buckets are stored as naive UTC
+    return d.astimezone(timezone.utc).replace(tzinfo=None) if d is not None and d.tzinfo else d
+
+
+@app.get("/api/history/{city}", response_model=HistoryOut)
+async def api_history(city: str, period: str = "hour", since: Optional[datetime] = None, until: Optional[datetime] = None,
+                      db: AsyncSession = Depends(get_db)):
+    """Hourly or daily min/max/mean, condition counts and query counts for a city.
+
+    Reads only the rollup tables, so the cost depends on the number of
+    buckets returned, not on how many raw rows were logged. Times are UTC.
+    """
+    if period not in ("hour", "day"):
+        raise HTTPException(status_code=422, detail='period must be "hour" or "day"')
+    name = rollup_city(city)
+    until = _naive_utc(until) or datetime.utcnow()
+    since = _naive_utc(since) or until - (timedelta(hours=HISTORY_DEFAULT_HOURS) if period == "hour" else timedelta(days=HISTORY_DEFAULT_DAYS))
+    # A bucket is keyed by its start, so the one `since` falls in would otherwise be skipped
+    since = bucket_start(period, since)
+    stats_model, condition_model = period_models(period)
+    stats = (await db.execute(
+        select(stats_model).where(stats_model.city == name, stats_model.bucket >= since, stats_model.bucket <= until).order_by(stats_model.bucket)
+    )).scalars().all()
+    conditions = (await db.execute(
+        select(condition_model).where(condition_model.city == name, condition_model.bucket >= since, condition_model.bucket <= until)
+    )).scalars().all()
+    return {"city": name, "period": period, "points": history_points(stats, conditions)}
+
+
+@app.get("/api/retention/status", response_model=RetentionStatusOut)
+async def api_retention_status():
+    """Raw-row retention window and how much the pruning job has deleted"""
+    return retention.status()
+
+
+@app.get("/api/startup", response_model=StartupOut)
+async def api_startup():
+    """How long this worker spent importing, setting up the schema and warming clients"""
+    return startup.report()
 
 
 @app.get("/api/cities", response_model=CitiesOut)
-def api_cities():
+async def api_cities(request: Request, response: Response):
     """Return list of Tamil Nadu cities"""
+    headers = cache_headers(CITIES_ETAG, None, CITIES_MAX_AGE)
+    if not_modified(request, CITIES_ETAG):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     return {"cities": TN_CITIES}
 
 
-@app.post("/api/chat", response_model=ChatOut)
-def api_chat(payload: ChatIn, db: Session = Depends(get_db)):
-    """Chat endpoint for voice assistant"""
+async def _chat_context(payload: ChatIn):
+    """Resolve (city, temp, humidity, condition) for a chat message."""
     # Extract context
     city = payload.context.get("city", "Chennai") if payload.context else "Chennai"
     
@@ -136,76 +523,84 @@ def api_chat(payload: ChatIn, db: Session = Depends(get_db)):
         condition = weather_data["weather"][0]["main"] if weather_data.get("weather") else "Clear"
     else:
         # Fetch fresh weather
-        raw = fetch_weather(city)
-        shaped = shape_basic_weather(raw)
+        shaped = await current_weather(city)
         temp = shaped["temp"]
         humidity = shaped["humidity"]
         condition = shaped["condition"]
+    return city, temp, humidity, condition
+
+
+@app.post("/api/chat", response_model=ChatOut)
+async def api_chat(payload: ChatIn):
+    """Chat endpoint for voice assistant"""
+    set_priority(INTERACTIVE)
+    deadline = start_deadline(INTERACTIVE_DEADLINE)
+    city, temp, humidity, condition = await _chat_context(payload)
     
     # Generate bilingual response
-    bilingual = generate_bilingual(
-        city, temp, humidity, condition, 0.0, payload.message
+    bilingual = await run_in_threadpool(
+        attributed, generate_bilingual, city, temp, humidity, condition, 0.0, payload.message, deadline
     )
     
     # Store query
-    q = Query(city=city, query_text=payload.message, response_text=bilingual.get("english", ""))
-    db.add(q)
-    db.commit()
+    await alog_query(city, payload.message, bilingual.get("english", ""))
     
     # Return response in requested language
     response_text = bilingual.get("tamil" if payload.lang == "ta" else "english", "")
     return {"response": response_text}
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def api_chat_stream(payload: ChatIn):
+    """Server-Sent Events variant of /api/chat.
+
+    Emits `delta` events with partial text in the requested language as the
+    model writes it, then one `done` event with the full Bilingual object
+    and the final response text.
+    """
+    field = "tamil" if payload.lang == "ta" else "english"
+
+    async def events():
+        set_priority(INTERACTIVE)
+        deadline = start_deadline(INTERACTIVE_DEADLINE)
+        city, temp, humidity, condition = await _chat_context(payload)
+        bilingual = None
+        # The SDK stream is blocking; each chunk is pulled in the threadpool
+        async for kind, data in iterate_in_threadpool(AttributedIterator(stream_bilingual(city, temp, humidity, condition, 0.0, payload.message, field=field, deadline=deadline))):
+            if kind == "delta":
+                if data:
+                    yield _sse("delta", {"text": data})
+            else:
+                bilingual = data
+                yield _sse("done", {"response": bilingual.get(field, ""), "bilingual": bilingual})
+        # Logged once the stream is complete (write-behind, so no DB wait)
+        if bilingual is not None:
+            await alog_query(city, payload.message, bilingual.get("english", ""))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.get("/api/preferences/{user_id}", response_model=PreferenceOut)
-def get_preferences(user_id: str, db: Session = Depends(get_db)):
-    """Get user preferences"""
-    pref = db.query(UserPreference).filter(UserPreference.id == user_id).first()
-    if not pref:
-        # Create default preferences
-        pref = UserPreference(id=user_id)
-        db.add(pref)
-        db.commit()
-        db.refresh(pref)
-    
-    return PreferenceOut(
-        id=pref.id,
-        language=pref.language,
-        notification_time=pref.notification_time,
-        voice_enabled=bool(pref.voice_enabled),
-        assistant_name=pref.assistant_name
-    )
+async def get_preferences(user_id: str, db: AsyncSession = Depends(get_db)):
+    """Get user preferences (defaults for unknown users; nothing is stored until they save)"""
+    return await preferences.get_preferences(db, user_id)
+
+
+@app.post("/api/preferences/bulk", response_model=PreferenceBulkOut)
+async def get_preferences_bulk(payload: PreferenceBulkIn, db: AsyncSession = Depends(get_db)):
+    """Preferences for many users at once, e.g. for the notification scheduler"""
+    return {"preferences": await preferences.get_preferences_bulk(db, payload.ids)}
 
 
 @app.post("/api/preferences", response_model=PreferenceOut)
-def save_preferences(payload: PreferenceIn, db: Session = Depends(get_db)):
+async def save_preferences(payload: PreferenceIn, db: AsyncSession = Depends(get_db)):
     """Save user preferences"""
-    pref = db.query(UserPreference).filter(UserPreference.id == payload.id).first()
-    
-    if pref:
-        # Update existing
-        pref.language = payload.language
-        pref.notification_time = payload.notification_time
-        pref.voice_enabled = int(payload.voice_enabled)
-        pref.assistant_name = payload.assistant_name
-    else:
-        # Create new
-        pref = UserPreference(
-            id=payload.id,
-            language=payload.language,
-            notification_time=payload.notification_time,
-            voice_enabled=int(payload.voice_enabled),
-            assistant_name=payload.assistant_name
-        )
-        db.add(pref)
-    
-    db.commit()
-    db.refresh(pref)
-    
-    return PreferenceOut(
-        id=pref.id,
-        language=pref.language,
-        notification_time=pref.notification_time,
-        voice_enabled=bool(pref.voice_enabled),
-        assistant_name=pref.assistant_name
-    )
+    return await preferences.save_preferences(db, payload.model_dump())
+
+
+# Everything above ran at import time
+startup.since_start("import")
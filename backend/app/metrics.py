@@ -0,0 +1,282 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from a cache hit up to an OWM timeout
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for key, child in sorted(self._children.items()):
+            yield from child.render(self.name, self.labelnames, key)
+
+
+class _Value:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def render(self, name, labelnames, key) -> Iterator[str]:
+        yield f"{name}{_fmt_labels(labelnames, key)} {_fmt_value(self.value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.labels().dec(amount)
+
+    def set(self, value: float) -> None:
+        self.labels().set(value)
+
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def render(self, name, labelnames, key) -> Iterator[str]:
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            yield f"{name}_bucket{_fmt_labels(labelnames, key, ('le', _fmt_value(bound)))} {cumulative}"
+        yield f"{name}_sum{_fmt_labels(labelnames, key)} {_fmt_value(total)}"
+        yield f"{name}_count{_fmt_labels(labelnames, key)} {cumulative}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+
+class Registry:
+    """Holds metrics plus collectors that produce samples at scrape time.
+
+    Collectors let existing counters (e.g. TTLCache.stats()) be exported
+    without adding any work to the hot path.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, fn: Callable[[], Iterable[str]]) -> None:
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception:
+                continue
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+
+def gauge(name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+
+def histogram(name: str, help: str, labelnames: Sequence[str] = (), buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+
+def render_family(name: str, help: str, kind: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> Iterator[str]:
+    """Format samples produced by a collector."""
+    yield f"# HELP {name} {help}"
+    yield f"# TYPE {name} {kind}"
+    for labels, value in samples:
+        yield f"{name}{_fmt_labels(list(labels), list(labels.values()))} {_fmt_value(value)}"
+
+
+def register_cache(name: str, cache) -> None:
+    """Export a TTLCache's own counters at scrape time (no per-lookup cost)."""
+    def collect() -> Iterator[str]:
+        st = cache.stats()
+        yield from render_family(f"maya_cache_{name}_requests_total", f"{name} cache lookups by result", "counter",
+                                 [({"result": r}, st[k]) for r, k in (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))])
+        yield from render_family(f"maya_cache_{name}_entries", f"{name} cache entries", "gauge", [({}, st["size"])])
+        yield from render_family(f"maya_cache_{name}_evictions_total", f"{name} cache LRU evictions", "counter", [({}, st["evictions"])])
+    REGISTRY.register_collector(collect)
+
+
+# Metrics shared across modules
+REQUEST_LATENCY = histogram("maya_http_request_duration_seconds", "HTTP request latency by route, until the last body byte", ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = gauge("maya_http_requests_in_flight", "HTTP requests currently being served", ("route",))
+OWM_LATENCY = histogram("maya_owm_fetch_duration_seconds", "OpenWeatherMap call latency", ("call", "outcome"))
+GEMINI_LATENCY = histogram("maya_gemini_generate_duration_seconds", "Gemini generate_content latency per model", ("model", "outcome"))
+GEMINI_PARSE_LATENCY = histogram("maya_gemini_parse_duration_seconds", "Time to parse and validate model output JSON", ("kind",),
+                                 buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+GEMINI_FALLBACK_HOPS = counter("maya_gemini_fallback_hops_total", "Times a request moved on to another model after a failure")
+GEMINI_HEDGES = counter("maya_gemini_hedges_total", "Hedged Gemini requests: fired, and won by the hedge", ("result",))
+GEMINI_DETERMINISTIC = counter("maya_gemini_deterministic_replies_total", "Replies served from deterministic fallback text", ("reason",))
+DB_COMMIT_LATENCY = histogram("maya_db_commit_duration_seconds", "Write-behind flush (bulk insert + commit) latency")
+RATE_WAIT = histogram("maya_ratelimit_wait_seconds", "Time spent waiting for an upstream token", ("bucket", "priority"))
+RATE_SHED = counter("maya_ratelimit_shed_total", "Requests shed because no token was available before their deadline", ("bucket", "priority"))
+DB_ROWS_WRITTEN = counter("maya_db_rows_written_total", "Rows persisted by the write-behind logger")
+
+
+def _path_group(path: str) -> str:
+    # The route template is only known after routing, so the in-flight gauge
+    # is keyed by the first segment under /api (weather, route, chat, ...)
+    parts = path.split("/")
+    return parts[2] if len(parts) > 2 and parts[1] == "api" and parts[2] else "other"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency histogram and in-flight gauge.
+
+    Latency is measured until the final body chunk, so streaming
+    endpoints report their full duration.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = {"code": 500}
+        inflight = REQUESTS_IN_FLIGHT.labels(_path_group(scope.get("path", "")))
+        inflight.inc()
+        finished = False
+
+        def done() -> None:
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            inflight.dec()
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            REQUEST_LATENCY.labels(scope.get("method", ""), template, str(status["code"])).observe(time.perf_counter() - started)
+
+        async def wrapped_send(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                done()
+
+        try:
+            await self.app(scope, receive, wrapped_send)
+        finally:
+            done()
@@ -0,0 +1,229 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+from .ratelimit import Shed
+
+# Cool-downs double on every consecutive trip, up to ROUTER_MAX_COOLDOWN
+ROUTER_RATE_LIMIT_COOLDOWN = float(os.getenv("ROUTER_RATE_LIMIT_COOLDOWN", "30"))
+ROUTER_RETIRED_COOLDOWN = float(os.getenv("ROUTER_RETIRED_COOLDOWN", "600"))
+ROUTER_ERROR_COOLDOWN = float(os.getenv("ROUTER_ERROR_COOLDOWN", "15"))
+ROUTER_MAX_COOLDOWN = float(os.getenv("ROUTER_MAX_COOLDOWN", "3600"))
+# Generic (non-429/404) errors in a row before the circuit opens
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3"))
+# Weight of the newest sample in the error-rate and latency moving averages
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+# Recent successful-call latencies kept per model for percentile queries
+ROUTER_LATENCY_WINDOW = int(os.getenv("ROUTER_LATENCY_WINDOW", "100"))
+ROUTER_LATENCY_MIN_SAMPLES = 5
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def classify_error(exc: BaseException) -> str:
+    """Map an SDK exception to 'retired', 'rate_limited' or 'error'."""
+    code = getattr(exc, "code", None)
+    msg = str(exc).lower()
+    if code == 404 or ("not found" in msg) or ("404" in msg) or ("unsupported" in msg):
+        return "retired"
+    if code == 429 or ("429" in msg) or ("quota" in msg) or ("resource exhausted" in msg) or ("rate limit" in msg):
+        return "rate_limited"
+    return "error"
+
+
+class AllModelsFailed(Exception):
+    """Raised by ModelRouter.call() when no model produced a result."""
+
+
+class ModelHealth:
+    """Per-model health counters and circuit state."""
+
+    def __init__(self, name: str, rank: int):
+        self.name = name
+        self.rank = rank  # position in the configured preference order
+        self.state = CLOSED
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.error_rate = 0.0
+        self.latency_ms: Optional[float] = None
+        self.latencies: "deque[float]" = deque(maxlen=ROUTER_LATENCY_WINDOW)
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.name,
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate, 4),
+            "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 1),
+            "retry_in": max(0.0, round(self.open_until - time.monotonic(), 1)) if self.state == OPEN else 0.0,
+            "last_error": self.last_error,
+        }
+
+
+class ModelRouter:
+    """Routes Gemini calls to the healthiest model.
+
+    Keeps one long-lived model instance per ID and a circuit breaker per
+    model. 404/unsupported and 429 responses open the circuit straight away.
+    Other errors open it after ROUTER_FAILURE_THRESHOLD in a row. When the
+    cool-down expires, the model goes half-open and gets a single probe
+    request. A successful probe closes the circuit; a failed one reopens it
+    with a doubled cool-down.
+    """
+
+    def __init__(self, model_ids: List[str], factory: Callable[[str], Any]):
+        self._factory = factory
+        self._instances: Dict[str, Any] = {}
+        self._health: Dict[str, ModelHealth] = {}
+        for mid in model_ids:
+            if mid not in self._health:
+                self._health[mid] = ModelHealth(mid, len(self._health))
+        self._lock = threading.Lock()
+        self._build_locks: Dict[str, threading.Lock] = {}
+
+    def get_model(self, name: str) -> Any:
+        inst = self._instances.get(name)
+        if inst is not None:
+            return inst
+        with self._lock:
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+        # Built outside the router lock: the first build may import the SDK, and
+        # candidates()/record_*() must not wait on that
+        with build_lock:
+            inst = self._instances.get(name)
+            if inst is None:
+                inst = self._factory(name)
+                self._instances[name] = inst
+            return inst
+
+    def _score(self, h: ModelHealth):
+        # Unmeasured models keep their preference order behind measured ones
+        latency = h.latency_ms if h.latency_ms is not None else float("inf")
+        return (round(h.error_rate, 1), latency, h.rank)
+
+    def candidates(self) -> List[str]:
+        """Model IDs to try, in order, skipping open circuits.
+
+        A model whose cool-down has expired is put first as a half-open
+        probe. Only one probe is in flight per model at a time.
+        """
+        now = time.monotonic()
+        probes: List[ModelHealth] = []
+        closed: List[ModelHealth] = []
+        with self._lock:
+            for h in self._health.values():
+                if h.state == OPEN and now >= h.open_until:
+                    h.state = HALF_OPEN
+                if h.state == HALF_OPEN:
+                    if not h.probing:
+                        h.probing = True
+                        probes.append(h)
+                elif h.state == CLOSED:
+                    closed.append(h)
+        closed.sort(key=self._score)
+        probes.sort(key=lambda h: h.rank)
+        return [h.name for h in probes + closed]
+
+    def _ewma(self, old: Optional[float], sample: float) -> float:
+        return sample if old is None else old + ROUTER_EWMA_ALPHA * (sample - old)
+
+    def record_success(self, name: str, latency: Optional[float] = None) -> None:
+        with self._lock:
+            h = self._health.get(name)
+            if h is None:
+                return
+            h.successes += 1
+            h.consecutive_failures = 0
+            h.error_rate = self._ewma(h.error_rate, 0.0)
+            if latency is not None:
+                h.latency_ms = self._ewma(h.latency_ms, latency * 1000.0)
+                h.latencies.append(latency)
+            h.state = CLOSED
+            h.trips = 0
+            h.probing = False
+
+    def record_failure(self, name: str, exc: BaseException) -> str:
+        kind = classify_error(exc)
+        with self._lock:
+            h = self._health.get(name)
+            if h is None:
+                return kind
+            h.failures += 1
+            h.consecutive_failures += 1
+            h.error_rate = self._ewma(h.error_rate, 1.0)
+            h.last_error = f"{kind}: {str(exc)[:200]}"
+            trip = (
+                kind != "error"
+                or h.state == HALF_OPEN
+                or h.consecutive_failures >= ROUTER_FAILURE_THRESHOLD
+            )
+            if trip:
+                base = {"retired": ROUTER_RETIRED_COOLDOWN, "rate_limited": ROUTER_RATE_LIMIT_COOLDOWN}.get(kind, ROUTER_ERROR_COOLDOWN)
+                cooldown = min(base * (2 ** h.trips), ROUTER_MAX_COOLDOWN)
+                h.trips += 1
+                h.state = OPEN
+                h.open_until = time.monotonic() + cooldown
+            h.probing = False
+        return kind
+
+    def latency_percentile(self, name: str, pct: float) -> Optional[float]:
+        """pct-th percentile of recent successful latencies in seconds, or None with too few samples."""
+        with self._lock:
+            h = self._health.get(name)
+            samples = sorted(h.latencies) if h is not None else []
+        if len(samples) < ROUTER_LATENCY_MIN_SAMPLES:
+            return None
+        rank = min(len(samples) - 1, max(0, int(round(pct / 100.0 * len(samples))) - 1))
+        return samples[rank]
+
+    def release(self, name: str) -> None:
+        """Give back an unused half-open probe slot."""
+        with self._lock:
+            h = self._health.get(name)
+            if h is not None:
+                h.probing = False
+
+    def call(self, fn: Callable[[str, Any], Any]) -> Any:
+        """Run fn(name, model) on each candidate in order until one succeeds.
+
+        Success and failure are recorded against each model tried. Raises
+        AllModelsFailed when every candidate fails or all circuits are open.
+        """
+        names = self.candidates()
+        last_exc: Optional[BaseException] = None
+        for i, name in enumerate(names):
+            started = time.perf_counter()
+            try:
+                result = fn(name, self.get_model(name))
+            except Shed as e:
+                # Our own admission control, not a model fault: leave its health alone
+                self.release(name)
+                last_exc = e
+                if e.service_wide:
+                    for rest in names[i + 1:]:
+                        self.release(rest)
+                    break
+                continue
+            except Exception as e:
+                self.record_failure(name, e)
+                last_exc = e
+                continue
+            self.record_success(name, time.perf_counter() - started)
+            for rest in names[i + 1:]:
+                self.release(rest)
+            return result
+        raise AllModelsFailed(str(last_exc) if last_exc else "no model available")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [h.to_dict() for h in sorted(self._health.values(), key=lambda h: h.rank)]
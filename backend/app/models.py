@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
@@ -19,6 +19,10 @@ class Query(Base):
     response_text = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
     user = relationship("User", back_populates="queries")
+    __table_args__ = (
+        Index("ix_queries_city_timestamp", "city", "timestamp"),
+        Index("ix_queries_timestamp", "timestamp"),  # retention
+    )
 
 class WeatherLog(Base):
     __tablename__ = "weather_logs"
@@ -28,6 +32,10 @@ class WeatherLog(Base):
     humidity = Column(Float)
     condition = Column(String)
     date = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ix_weather_logs_city_date", "city", "date"),
+        Index("ix_weather_logs_date", "date"),  # retention
+    )
 
 class UserPreference(Base):
     __tablename__ = "user_preferences"
@@ -37,3 +45,46 @@ class UserPreference(Base):
     voice_enabled = Column(Integer, default=1)  # SQLite doesn't have boolean
     assistant_name = Column(String, default="Maya")
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class LLMResponseCache(Base):
+    __tablename__ = "llm_response_cache"
+    key = Column(String, primary_key=True)  # sha1 of the quantized weather + query
+    payload = Column(Text)  # JSON-encoded Bilingual
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class _WeatherRollup:
+    # One row per city per bucket; the (city, bucket) primary key is the history index
+    city = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)  # start of the hour/day, UTC
+    samples = Column(Integer, default=0)
+    temp_min = Column(Float, nullable=True)
+    temp_max = Column(Float, nullable=True)
+    temp_sum = Column(Float, default=0.0)
+    humidity_min = Column(Float, nullable=True)
+    humidity_max = Column(Float, nullable=True)
+    humidity_sum = Column(Float, default=0.0)
+    queries = Column(Integer, default=0)
+
+
+class WeatherHourly(_WeatherRollup, Base):
+    __tablename__ = "weather_hourly"
+
+
+class WeatherDaily(_WeatherRollup, Base):
+    __tablename__ = "weather_daily"
+
+
+class _ConditionRollup:
+    city = Column(String, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    condition = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+
+
+class ConditionHourly(_ConditionRollup, Base):
+    __tablename__ = "condition_hourly"
+
+
+class ConditionDaily(_ConditionRollup, Base):
+    __tablename__ = "condition_daily"
@@ -0,0 +1,272 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from .cache import normalize_key
+from .database import SessionLocal
+from .models import WeatherLog
+
+logger = logging.getLogger(__name__)
+
+NOWCAST_ENABLED = os.getenv("NOWCAST_ENABLED", "1").lower() in ("1", "true", "yes")
+# History loaded on startup; afterwards only rows newer than the last one seen are read
+NOWCAST_HISTORY_HOURS = float(os.getenv("NOWCAST_HISTORY_HOURS", "72"))
+NOWCAST_INTERVAL = float(os.getenv("NOWCAST_INTERVAL", "60"))
+# Holt smoothing factors for level and trend, and plain smoothing for the rain indicator
+NOWCAST_ALPHA = float(os.getenv("NOWCAST_ALPHA", "0.5"))
+NOWCAST_BETA = float(os.getenv("NOWCAST_BETA", "0.2"))
+NOWCAST_RAIN_ALPHA = float(os.getenv("NOWCAST_RAIN_ALPHA", "0.3"))
+NOWCAST_MIN_OBS = int(os.getenv("NOWCAST_MIN_OBS", "3"))
+# Cities not observed for this long get no prediction
+NOWCAST_MAX_AGE_HOURS = float(os.getenv("NOWCAST_MAX_AGE_HOURS", "6"))
+# The trend is extrapolated at most this far past the last observation
+NOWCAST_MAX_HORIZON_HOURS = float(os.getenv("NOWCAST_MAX_HORIZON_HOURS", "3"))
+NOWCAST_BATCH = int(os.getenv("NOWCAST_BATCH", "5000"))
+
+# OWM refreshes roughly every 10 minutes; closer observations would inflate the trend
+MIN_STEP_HOURS = 1.0 / 6.0
+_RAIN_WORDS = ("rain", "drizzle", "shower", "thunder", "storm")
+
+Row = Tuple[int, str, float, float, str, float]  # id, city, temp, humidity, condition, unix time
+
+
+def _is_rain(condition: str) -> float:
+    c = (condition or "").lower()
+    return 1.0 if any(w in c for w in _RAIN_WORDS) else 0.0
+
+
+def _epoch(d: datetime) -> float:
+    # WeatherLog.date is naive UTC
+    return d.replace(tzinfo=timezone.utc).timestamp()
+
+
+class Nowcaster:
+    """Short-horizon temperature/humidity/rain estimates from WeatherLog history.
+
+    Every city is one row in a set of NumPy arrays: Holt level and trend
+    for [temp, humidity], a smoothed rain indicator and the last
+    observation time. New rows are folded in with one vectorized step per
+    observation index across all cities, so a refresh costs
+    O(new rows), not O(history). Trends are per hour, so irregular
+    sampling is handled.
+    """
+
+    def __init__(self, alpha: float = NOWCAST_ALPHA, beta: float = NOWCAST_BETA, rain_alpha: float = NOWCAST_RAIN_ALPHA,
+                 min_obs: int = NOWCAST_MIN_OBS, max_age_hours: float = NOWCAST_MAX_AGE_HOURS,
+                 max_horizon_hours: float = NOWCAST_MAX_HORIZON_HOURS, interval: float = NOWCAST_INTERVAL):
+        self.alpha = alpha
+        self.beta = beta
+        self.rain_alpha = rain_alpha
+        self.min_obs = min_obs
+        self.max_age = max_age_hours * 3600.0
+        self.max_horizon = max_horizon_hours
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._conditions: List[str] = []
+        self._level = np.zeros((0, 2))
+        self._trend = np.zeros((0, 2))
+        self._last_x = np.zeros((0, 2))
+        self._rain = np.zeros(0)
+        self._count = np.zeros(0, dtype=np.int64)
+        self._last_ts = np.zeros(0)  # last distinct reading
+        self._seen_ts = np.zeros(0)  # last row of any kind
+        self._last_id = 0
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.rows_ingested = 0
+        self.last_refresh: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def _grow(self, n: int) -> None:
+        self._level = np.vstack([self._level, np.zeros((n, 2))])
+        self._trend = np.vstack([self._trend, np.zeros((n, 2))])
+        self._last_x = np.vstack([self._last_x, np.full((n, 2), np.nan)])
+        self._rain = np.concatenate([self._rain, np.zeros(n)])
+        self._count = np.concatenate([self._count, np.zeros(n, dtype=np.int64)])
+        self._last_ts = np.concatenate([self._last_ts, np.zeros(n)])
+        self._seen_ts = np.concatenate([self._seen_ts, np.zeros(n)])
+
+    def _city_rows(self, cities: Sequence[str]) -> np.ndarray:
+        idx = np.empty(len(cities), dtype=np.int64)
+        added = 0
+        for i, name in enumerate(cities):
+            key = normalize_key(name)
+            j = self._index.get(key)
+            if j is None:
+                j = self._index[key] = len(self._names)
+                self._names.append(name)
+                self._conditions.append("")
+                added += 1
+            idx[i] = j
+        if added:
+            self._grow(added)
+        return idx
+
+    def ingest(self, rows: Sequence[Row]) -> int:
+        """Fold rows (ordered by id) into the per-city state."""
+        if not rows:
+            return 0
+        with self._lock:
+            city = self._city_rows([r[1] for r in rows])
+            x = np.array([(r[2], r[3]) for r in rows], dtype=float)
+            rain = np.array([_is_rain(r[4]) for r in rows])
+            ts = np.array([r[5] for r in rows], dtype=float)
+
+            # Position of each row among its city's new rows, keeping id order
+            order = np.argsort(city, kind="stable")
+            sorted_city = city[order]
+            starts = np.flatnonzero(np.r_[True, sorted_city[1:] != sorted_city[:-1]])
+            sizes = np.diff(np.r_[starts, len(rows)])
+            pos = np.empty(len(rows), dtype=np.int64)
+            pos[order] = np.arange(len(rows)) - np.repeat(starts, sizes)
+
+            n_cities, steps = len(self._names), int(pos.max()) + 1
+            X = np.full((n_cities, steps, 2), np.nan)
+            R = np.full((n_cities, steps), np.nan)
+            T = np.full((n_cities, steps), np.nan)
+            X[city, pos] = x
+            R[city, pos] = rain
+            T[city, pos] = ts
+            with np.errstate(invalid="ignore"):
+                for j in range(steps):
+                    self._step(X[:, j], R[:, j], T[:, j])
+
+            for i, r in zip(city, rows):
+                self._conditions[i] = r[4] or self._conditions[i]
+            self._last_id = max(self._last_id, rows[-1][0])
+            self.rows_ingested += len(rows)
+        return len(rows)
+
+    def _step(self, x: np.ndarray, r: np.ndarray, t: np.ndarray) -> None:
+        has = ~np.isnan(t)
+        # Repeats of the previous reading (the same cached observation logged again) carry no information
+        new = has & ~np.all(x == self._last_x, axis=1)
+        first = new & (self._count == 0)
+        upd = new & ~first
+        dt = np.maximum((t - self._last_ts) / 3600.0, MIN_STEP_HOURS)[:, None]
+
+        level = self.alpha * x + (1 - self.alpha) * (self._level + self._trend * dt)
+        trend = self.beta * (level - self._level) / dt + (1 - self.beta) * self._trend
+        rain = self.rain_alpha * r + (1 - self.rain_alpha) * self._rain
+
+        f, u = first[:, None], upd[:, None]
+        self._level = np.where(f, x, np.where(u, level, self._level))
+        self._trend = np.where(f, 0.0, np.where(u, trend, self._trend))
+        self._rain = np.where(first, r, np.where(upd, rain, self._rain))
+        self._last_x = np.where(new[:, None], x, self._last_x)
+        self._last_ts = np.where(new, t, self._last_ts)
+        self._seen_ts = np.where(has, np.fmax(t, self._seen_ts), self._seen_ts)
+        self._count += new
+
+    def _forecast(self, now: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(ok mask, [temp, humidity] estimates, rain probability %) for every city."""
+        ok = (self._count >= self.min_obs) & (now - self._seen_ts <= self.max_age)
+        horizon = np.clip((now - self._last_ts) / 3600.0, 0.0, self.max_horizon)[:, None]
+        est = self._level + self._trend * horizon
+        est[:, 1] = np.clip(est[:, 1], 0.0, 100.0)
+        return ok, est, np.clip(self._rain * 100.0, 0.0, 100.0)
+
+    def _raw(self, i: int, est: np.ndarray, rain: np.ndarray) -> Dict[str, Any]:
+        # OWM-shaped so shape_basic_weather() can consume it
+        condition = self._conditions[i] or "Unknown"
+        return {
+            "name": self._names[i],
+            "main": {"temp": round(float(est[i, 0]), 1), "humidity": round(float(est[i, 1]))},
+            "weather": [{"main": condition.split()[-1].title(), "description": condition}],
+            "rain_chance": round(float(rain[i]), 1),
+            "source": "nowcast",
+        }
+
+    def predict(self, city: str, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            i = self._index.get(normalize_key(city))
+            if i is None:
+                return None
+            ok, est, rain = self._forecast(now or time.time())
+            return self._raw(i, est, rain) if ok[i] else None
+
+    def predict_all(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        now = now or time.time()
+        with self._lock:
+            ok, est, rain = self._forecast(now)
+            out = []
+            for i in np.flatnonzero(ok):
+                raw = self._raw(int(i), est, rain)
+                out.append({
+                    "city": raw["name"],
+                    "temp": raw["main"]["temp"],
+                    "humidity": raw["main"]["humidity"],
+                    "rain_chance": raw["rain_chance"],
+                    "observations": int(self._count[i]),
+                    "age_minutes": round((now - float(self._seen_ts[i])) / 60.0, 1),
+                })
+            return out
+
+    def refresh(self) -> int:
+        """Read WeatherLog rows newer than the last one seen and fold them in."""
+        total = 0
+        while True:
+            q = select(WeatherLog.id, WeatherLog.city, WeatherLog.temp, WeatherLog.humidity, WeatherLog.condition, WeatherLog.date)
+            q = q.where(WeatherLog.id > self._last_id)
+            if self._last_id == 0:
+                q = q.where(WeatherLog.date >= datetime.utcnow() - timedelta(hours=NOWCAST_HISTORY_HOURS))
+            with SessionLocal() as db:
+                rows = db.execute(q.order_by(WeatherLog.id).limit(NOWCAST_BATCH)).all()
+            batch = [(r.id, r.city, r.temp, r.humidity, r.condition, _epoch(r.date)) for r in rows
+                     if r.city and r.temp is not None and r.humidity is not None and r.date is not None]
+            total += self.ingest(batch)
+            if rows and not batch:
+                # Only unusable rows in this page; skip past them
+                self._last_id = rows[-1].id
+            if len(rows) < NOWCAST_BATCH:
+                break
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        return total
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e) or e.__class__.__name__
+                logger.warning("nowcast refresh failed: %s", self.last_error)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if NOWCAST_ENABLED and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": NOWCAST_ENABLED,
+            "cities": len(self._names),
+            "rows_ingested": self.rows_ingested,
+            "refreshes": self.refreshes,
+            "last_refresh": datetime.fromtimestamp(self.last_refresh, timezone.utc).isoformat() if self.last_refresh else None,
+            "last_error": self.last_error,
+        }
+
+
+nowcaster = Nowcaster()
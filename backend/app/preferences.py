@@ -0,0 +1,108 @@
+import os
+from datetime import timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .cache import TTLCache
+from .models import UserPreference
+from .metrics import register_cache
+from .shared import CACHE_BACKEND, make_backend
+
+# With per-worker (memory) caches a save only refreshes the worker that handled it; others see it once this expires
+PREF_CACHE_TTL = float(os.getenv("PREF_CACHE_TTL", "600" if CACHE_BACKEND == "sqlite" else "30"))
+PREF_CACHE_SIZE = int(os.getenv("PREF_CACHE_SIZE", "4096"))
+# Ids per IN (...) query; SQLite caps bound parameters per statement
+PREF_QUERY_CHUNK = 500
+
+pref_cache = TTLCache(maxsize=PREF_CACHE_SIZE, ttl=PREF_CACHE_TTL, backend=make_backend("preferences", PREF_CACHE_SIZE))
+register_cache("preferences", pref_cache)
+
+
+def default_preferences(user_id: str) -> Dict[str, Any]:
+    return {"id": user_id, "language": "en", "notification_time": "08:00", "voice_enabled": True, "assistant_name": "Maya"}
+
+
+def _version(pref: Optional[UserPreference]) -> float:
+    # Entries are cached with the row's updated_at, so a load that read an older row never replaces a newer save
+    if pref is None or pref.updated_at is None:
+        return 0.0
+    return pref.updated_at.replace(tzinfo=timezone.utc).timestamp()
+
+
+async def _cached(user_id: str) -> Optional[Dict[str, Any]]:
+    entry = await pref_cache.aget(user_id)
+    # Entries cached before versioning was added are plain dicts; treat them as misses
+    return entry[1] if isinstance(entry, list) else None
+
+
+def _as_dict(pref: UserPreference) -> Dict[str, Any]:
+    return {
+        "id": pref.id,
+        "language": pref.language,
+        "notification_time": pref.notification_time,
+        "voice_enabled": bool(pref.voice_enabled),
+        "assistant_name": pref.assistant_name,
+    }
+
+
+async def get_preferences(db: AsyncSession, user_id: str) -> Dict[str, Any]:
+    """Stored preferences, or the defaults for an unknown user. Never writes."""
+    cached = await _cached(user_id)
+    if cached is not None:
+        return cached
+    pref = await db.get(UserPreference, user_id)
+    # Unknown users are cached too, so repeat visits from new sessions stay off the DB
+    data = _as_dict(pref) if pref is not None else default_preferences(user_id)
+    await pref_cache.aset_newer(user_id, _version(pref), data)
+    return data
+
+
+async def get_preferences_bulk(db: AsyncSession, user_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """Preferences for many users (input order, duplicates dropped) with one query per chunk of misses."""
+    ids = list(dict.fromkeys(user_ids))
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for user_id in ids:
+        cached = await _cached(user_id)
+        if cached is None:
+            missing.append(user_id)
+        else:
+            found[user_id] = cached
+    loaded: Dict[str, UserPreference] = {}
+    for off in range(0, len(missing), PREF_QUERY_CHUNK):
+        chunk = missing[off:off + PREF_QUERY_CHUNK]
+        rows = await db.scalars(select(UserPreference).where(UserPreference.id.in_(chunk)))
+        for pref in rows:
+            loaded[pref.id] = pref
+    for user_id in missing:
+        pref = loaded.get(user_id)
+        data = _as_dict(pref) if pref is not None else default_preferences(user_id)
+        await pref_cache.aset_newer(user_id, _version(pref), data)
+        found[user_id] = data
+    return [found[user_id] for user_id in ids]
+
+
+async def save_preferences(db: AsyncSession, values: Dict[str, Any]) -> Dict[str, Any]:
+    """Upsert one user's preferences and refresh the cached copy."""
+    pref = await db.get(UserPreference, values["id"])
+    if pref is None:
+        pref = UserPreference(id=values["id"])
+        db.add(pref)
+    pref.language = values["language"]
+    pref.notification_time = values["notification_time"]
+    pref.voice_enabled = int(values["voice_enabled"])
+    pref.assistant_name = values["assistant_name"]
+    try:
+        await db.commit()
+    except Exception:
+        await pref_cache.adelete(values["id"])
+        raise
+    data = _as_dict(pref)
+    await pref_cache.aset_newer(pref.id, _version(pref), data)
+    return data
+
+
+def preference_cache_stats() -> Dict[str, Any]:
+    return pref_cache.stats()
@@ -0,0 +1,296 @@
+import os
+import sys
+import hmac
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import Counter, deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+# Admin token for the /api/profiler endpoints and the X-Profile-Token header; unset disables profiling
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+# Profiled requests kept for /api/profiler/stacks (oldest dropped first)
+PROFILE_RING_SIZE = int(os.getenv("PROFILE_RING_SIZE", "200"))
+PROFILE_MAX_DEPTH = int(os.getenv("PROFILE_MAX_DEPTH", "64"))
+# Distinct stacks kept per request; the rest are counted under "[truncated]"
+PROFILE_MAX_STACKS = int(os.getenv("PROFILE_MAX_STACKS", "500"))
+# Sampling switches itself off after this many seconds unless a duration is given
+PROFILE_DEFAULT_DURATION = float(os.getenv("PROFILE_DEFAULT_DURATION", "600"))
+
+_current: contextvars.ContextVar[Optional["_Session"]] = contextvars.ContextVar("profile_session", default=None)
+
+
+class _Session:
+    __slots__ = ("method", "path", "route", "loop", "loop_thread", "task", "threads", "stacks", "samples", "started", "duration")
+
+    def __init__(self, method: str, path: str, loop: asyncio.AbstractEventLoop, task: Optional[asyncio.Task]):
+        self.method = method
+        self.path = path
+        self.route = path
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.task = task
+        self.threads: set = set()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.duration = 0.0
+
+    def add(self, stack: str) -> None:
+        self.samples += 1
+        if stack in self.stacks or len(self.stacks) < PROFILE_MAX_STACKS:
+            self.stacks[stack] += 1
+        else:
+            self.stacks["[truncated]"] += 1
+
+
+class SamplingProfiler:
+    """Statistical profiler for a sampled fraction of live requests.
+
+    While at least one profiled request is in flight, a background thread
+    snapshots sys._current_frames() every PROFILE_INTERVAL_MS. A sample of
+    the event loop thread goes to the request whose task is running on it
+    (idle time in select() isn't sampled). Threadpool and Gemini worker
+    threads are sampled while they run work for a profiled request, which
+    callers mark by going through attributed().
+    Finished requests go into a ring of PROFILE_RING_SIZE, rendered as
+    collapsed stacks for flamegraph.pl / speedscope.
+
+    Without PROFILE_TOKEN the middleware is a single check per request.
+    With it, a request costs a header scan, plus one random() call while
+    sampling is on.
+    """
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, ring_size: int = PROFILE_RING_SIZE):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.rate = 0.0
+        self.routes: List[str] = []
+        self.until = 0.0
+        self._lock = threading.Lock()
+        self._active: Dict[int, _Session] = {}
+        self._ring: "deque[_Session]" = deque(maxlen=max(1, ring_size))
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+        self.profiled = 0
+        self.samples = 0
+
+    # Control
+
+    def configure(self, rate: float, duration: Optional[float] = None, routes: Optional[List[str]] = None) -> None:
+        self.routes = [r for r in (routes or []) if r]
+        self.until = time.monotonic() + (duration if duration is not None else PROFILE_DEFAULT_DURATION)
+        self.rate = max(0.0, min(1.0, rate))
+
+    @property
+    def enabled(self) -> bool:
+        if self.rate > 0 and time.monotonic() >= self.until:
+            self.rate = 0.0
+        return self.rate > 0
+
+    def should_profile(self, path: str) -> bool:
+        if not self.enabled:
+            return False
+        if self.routes and not any(path.startswith(r) for r in self.routes):
+            return False
+        return random.random() < self.rate
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ring.clear()
+
+    # Sessions
+
+    def begin(self, method: str, path: str) -> _Session:
+        session = _Session(method, path, asyncio.get_running_loop(), asyncio.current_task())
+        with self._lock:
+            self._active[id(session)] = session
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return session
+
+    def end(self, session: _Session, route: Optional[str]) -> None:
+        session.duration = time.perf_counter() - session.started
+        if route:
+            session.route = route
+        with self._lock:
+            self._active.pop(id(session), None)
+            self._ring.append(session)
+            self.profiled += 1
+
+    # Sampling
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = f"{os.path.basename(code.co_filename)}:{name}".replace(";", ":").replace(" ", "_")
+            self._labels[code] = label
+        return label
+
+    def _stack(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+            names.append(self._label(frame.f_code))
+            frame = frame.f_back
+        names.reverse()
+        return ";".join(names)
+
+    def _sample(self, sessions: List[_Session]) -> None:
+        frames = sys._current_frames()
+        loops: Dict[Tuple[asyncio.AbstractEventLoop, int], None] = {}
+        by_task: Dict[Any, _Session] = {}
+        for s in sessions:
+            loops[(s.loop, s.loop_thread)] = None
+            if s.task is not None:
+                by_task[s.task] = s
+            for tid in list(s.threads):
+                frame = frames.get(tid)
+                if frame is not None:
+                    s.add(self._stack(frame))
+        for loop, tid in loops:
+            task = asyncio.current_task(loop)
+            if task is None:
+                continue
+            s = by_task.get(task)
+            if s is None and hasattr(task, "get_context"):
+                # Python 3.12+: tasks the request spawned (e.g. a streamed body) carry its context
+                s = task.get_context().get(_current)
+            frame = frames.get(tid)
+            if s is not None and frame is not None:
+                s.add(self._stack(frame))
+        del frames
+        self.samples += 1
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait()
+            with self._lock:
+                sessions = list(self._active.values())
+                if not sessions:
+                    self._wake.clear()
+                    continue
+            try:
+                self._sample(sessions)
+            except Exception:
+                pass
+            time.sleep(self.interval)
+
+    # Reports
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """Stacks summed per route as "METHOD route;frame;...;frame count" lines."""
+        totals: Counter = Counter()
+        with self._lock:
+            sessions = list(self._ring)
+        for s in sessions:
+            if route and s.route != route:
+                continue
+            root = f"{s.method}_{s.route}".replace(";", ":").replace(" ", "_")
+            for stack, n in list(s.stacks.items()):
+                totals[f"{root};{stack}"] += n
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(totals.items()))
+
+    def status(self) -> Dict[str, Any]:
+        enabled = self.enabled
+        with self._lock:
+            ring = list(self._ring)
+            active = len(self._active)
+        routes: Dict[str, int] = {}
+        for s in ring:
+            key = f"{s.method} {s.route}"
+            routes[key] = routes.get(key, 0) + 1
+        return {
+            "enabled": enabled,
+            "rate": self.rate,
+            "routes": list(self.routes),
+            "expires_in": round(max(0.0, self.until - time.monotonic()), 1) if enabled else None,
+            "interval_ms": round(self.interval * 1000.0, 3),
+            "active": active,
+            "profiled": self.profiled,
+            "samples": self.samples,
+            "ring_size": self._ring.maxlen,
+            "ring": routes,
+        }
+
+
+profiler = SamplingProfiler()
+
+
+def attributed(fn: Callable[..., Any], *args: Any) -> Any:
+    """Run fn(*args) on this worker thread, sampled as part of the caller's profiled request (if any).
+
+    Pass it to run_in_threadpool or an executor in front of the real
+    function; the worker sees the request through the copied context.
+    """
+    session = _current.get()
+    if session is None:
+        return fn(*args)
+    tid = threading.get_ident()
+    session.threads.add(tid)
+    try:
+        return fn(*args)
+    finally:
+        session.threads.discard(tid)
+
+
+class AttributedIterator:
+    """Wraps a blocking iterator for iterate_in_threadpool so each next() is attributed()."""
+
+    def __init__(self, iterable: Iterable[Any]):
+        self._it = iter(iterable)
+
+    def __iter__(self) -> "AttributedIterator":
+        return self
+
+    def __next__(self) -> Any:
+        return attributed(next, self._it)
+
+
+def _token_ok(value: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and value is not None and hmac.compare_digest(value.encode(), PROFILE_TOKEN.encode())
+
+
+def require_profile_token(request: Request) -> None:
+    """Dependency for the profiler endpoints."""
+    if not PROFILE_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (PROFILE_TOKEN is not set)")
+    if not _token_ok(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Profile-Token")
+
+
+class ProfilerMiddleware:
+    """Pure ASGI middleware: profiles sampled requests, and any request with a valid X-Profile-Token."""
+
+    def __init__(self, app, sampler: SamplingProfiler = profiler):
+        self.app = app
+        self.sampler = sampler
+
+    def _wanted(self, scope) -> bool:
+        path = scope.get("path", "")
+        if path.startswith("/api/profiler"):
+            return False
+        for k, v in scope.get("headers", ()):
+            if k == b"x-profile-token":
+                return _token_ok(v.decode("latin-1"))
+        return self.sampler.should_profile(path)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not PROFILE_TOKEN or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        session = self.sampler.begin(scope.get("method", ""), scope.get("path", ""))
+        token = _current.set(session)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            self.sampler.end(session, getattr(route, "path", None))
@@ -0,0 +1,367 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import RATE_WAIT, RATE_SHED, REGISTRY, render_family
+from .shared import RATE_SHARED, SharedStore, shared_store
+
+# Lower value = served first
+INTERACTIVE = 0  # voice, chat, single-city weather
+DEFAULT = 1
+BATCH = 2  # route planner
+BACKGROUND = 3  # warmer, probes
+PRIORITY_NAMES = {INTERACTIVE: "interactive", DEFAULT: "default", BATCH: "batch", BACKGROUND: "background"}
+
+# Requests per minute; 0 disables a bucket
+OWM_RATE_PER_MIN = float(os.getenv("OWM_RATE_PER_MIN", "60"))
+GEMINI_RATE_PER_MIN = float(os.getenv("GEMINI_RATE_PER_MIN", "60"))
+GEMINI_MODEL_RATE_PER_MIN = float(os.getenv("GEMINI_MODEL_RATE_PER_MIN", "15"))
+# Per-model overrides, e.g. "gemini-2.5-flash=10,gemini-2.0-flash=15"
+GEMINI_MODEL_RATES = os.getenv("GEMINI_MODEL_RATES", "")
+# Share of each bucket that only interactive requests may use
+RATE_INTERACTIVE_RESERVE = float(os.getenv("RATE_INTERACTIVE_RESERVE", "0.2"))
+# Longest a request waits for a token (unless its own deadline is sooner) before it is shed
+RATE_MAX_WAIT = {
+    INTERACTIVE: float(os.getenv("RATE_MAX_WAIT_INTERACTIVE", "2")),
+    DEFAULT: float(os.getenv("RATE_MAX_WAIT_DEFAULT", "5")),
+    BATCH: float(os.getenv("RATE_MAX_WAIT_BATCH", "10")),
+    BACKGROUND: float(os.getenv("RATE_MAX_WAIT_BACKGROUND", "30")),
+}
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("request_priority", default=DEFAULT)
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+
+def set_priority(priority: int) -> None:
+    """Priority for upstream calls made by the current request (copied into threadpool calls)."""
+    _priority.set(priority)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def set_deadline(deadline: Optional[float]) -> None:
+    """Absolute time.monotonic() by which the current request must be answered."""
+    _deadline.set(deadline)
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in spec.split(","):
+        name, _, rate = part.partition("=")
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+class Shed(Exception):
+    """A request gave up on a token because it could not get one before its deadline."""
+
+    def __init__(self, bucket: str, priority: int, service_wide: bool = False):
+        super().__init__(f"{bucket}: shed {PRIORITY_NAMES.get(priority, priority)} request, no token before deadline")
+        self.bucket = bucket
+        self.priority = priority
+        self.service_wide = service_wide
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "wake", "started", "queued")
+
+    def __init__(self, priority: int, seq: int, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+        self.started = time.monotonic()
+        self.queued = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class TokenBucket:
+    """Token bucket with a priority queue of waiters.
+
+    Only the head of the queue (best priority, then arrival order) may
+    take a token, so a burst of batch work can't starve interactive
+    callers. Non-interactive callers also leave the last
+    RATE_INTERACTIVE_RESERVE of the bucket alone. A waiter whose expected
+    wait exceeds its deadline is shed immediately rather than left to
+    time out. Usable from threads (acquire) and coroutines (aacquire).
+
+    With a SharedStore the token level lives there, so every worker on the
+    host draws from one budget; the waiter queue stays per process.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, capacity: Optional[float] = None,
+                 reserve: float = RATE_INTERACTIVE_RESERVE, service_wide: bool = False, store: Optional[SharedStore] = None):
+        self.name = name
+        self.enabled = rate_per_minute > 0
+        self.rate = rate_per_minute / 60.0
+        # Default burst: one minute's worth, matching how the upstream quotas are counted
+        self.capacity = capacity or max(1.0, rate_per_minute)
+        self.reserve = reserve * self.capacity
+        self.service_wide = service_wide
+        self.store = store
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self.granted = 0
+        self.shed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self, need: float) -> bool:
+        """Consume a token if at least `need` are available (tokens already refilled)."""
+        if self.tokens < need:
+            return False
+        self.tokens -= 1.0
+        return True
+
+    def _need(self, priority: int) -> float:
+        return 1.0 + (self.reserve if priority > INTERACTIVE else 0.0)
+
+    def _grant(self, w: _Waiter, now: float) -> None:
+        self._remove(w)
+        waited = now - w.started
+        self.granted += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        RATE_WAIT.labels(self.name, PRIORITY_NAMES[w.priority]).observe(waited)
+
+    def _remove(self, w: _Waiter) -> None:
+        if not w.queued:
+            return
+        was_head = self._heap[0] is w
+        self._heap.remove(w)
+        heapq.heapify(self._heap)
+        w.queued = False
+        if was_head and self._heap:
+            self._heap[0].wake()
+
+    def _enqueue(self, w: _Waiter) -> None:
+        if not w.queued:
+            heapq.heappush(self._heap, w)
+            w.queued = True
+
+    def _step(self, w: _Waiter, deadline: float) -> Optional[float]:
+        """Under the lock: grant a token (None) or return how long to sleep. Raises Shed."""
+        now = time.monotonic()
+        self._refill(now)
+        need = self._need(w.priority)
+        if not w.queued and not self._heap and self._take(need):
+            self._grant(w, now)
+            return None
+        self._enqueue(w)
+        if self._heap[0] is w and self._take(need):
+            self._grant(w, now)
+            return None
+        return self._wait(w, need, now, deadline)
+
+    def _shared_step(self, w: _Waiter, deadline: float) -> Optional[float]:
+        """_step() for a bucket in the SharedStore; call without the lock.
+
+        The store transaction can wait on other workers, so it runs outside
+        the lock, which only covers the local level and the waiter queue.
+        """
+        need = self._need(w.priority)
+        with self._lock:
+            eligible = self._heap[0] is w if w.queued else not self._heap
+            if not eligible:
+                self._enqueue(w)
+                return self._wait(w, need, time.monotonic(), deadline)
+        taken, tokens = self.store.bucket_take(self.name, self.rate, self.capacity, need)
+        now = time.monotonic()
+        with self._lock:
+            self.tokens = tokens
+            if taken:
+                self._grant(w, now)
+                return None
+            self._enqueue(w)
+            return self._wait(w, need, now, deadline)
+
+    def _wait(self, w: _Waiter, need: float, now: float, deadline: float) -> float:
+        """Under the lock, for a queued waiter: how long to sleep before trying again. Raises Shed."""
+        if self._heap[0] is w:
+            wait = max(0.0, (need - self.tokens) / self.rate)
+        else:
+            # Everyone ahead takes a token first; woken early if we reach the head
+            ahead = sum(1 for o in self._heap if o < w)
+            wait = max(0.0, (ahead + need - self.tokens) / self.rate)
+        remaining = deadline - now
+        if wait > remaining:
+            self._remove(w)
+            self.shed += 1
+            RATE_SHED.labels(self.name, PRIORITY_NAMES[w.priority]).inc()
+            raise Shed(self.name, w.priority, self.service_wide)
+        return min(wait, remaining)
+
+    def refund(self) -> None:
+        """Give back a granted token whose call never went ahead."""
+        if not self.enabled:
+            return
+        tokens = None
+        if self.store is not None:
+            tokens = self.store.bucket_refund(self.name, self.rate, self.capacity)
+        with self._lock:
+            if tokens is None:
+                self._refill(time.monotonic())
+                tokens = min(self.capacity, self.tokens + 1.0)
+            self.tokens = tokens
+            self.granted -= 1
+            if self._heap:
+                self._heap[0].wake()
+
+    def _locked_step(self, w: _Waiter, deadline: float) -> Optional[float]:
+        if self.store is not None:
+            return self._shared_step(w, deadline)
+        with self._lock:
+            return self._step(w, deadline)
+
+    def _resolve(self, priority: Optional[int], deadline: Optional[float]):
+        priority = current_priority() if priority is None else priority
+        limit = time.monotonic() + RATE_MAX_WAIT.get(priority, RATE_MAX_WAIT[DEFAULT])
+        deadline = current_deadline() if deadline is None else deadline
+        return priority, limit if deadline is None else min(deadline, limit)
+
+    def acquire(self, priority: Optional[int] = None, deadline: Optional[float] = None) -> None:
+        """Block the calling thread until a token is granted."""
+        if not self.enabled:
+            return
+        priority, deadline = self._resolve(priority, deadline)
+        event = threading.Event()
+        w = _Waiter(priority, next(self._seq), event.set)
+        while True:
+            delay = self._locked_step(w, deadline)
+            if delay is None:
+                return
+            event.wait(delay)
+            event.clear()
+
+    async def aacquire(self, priority: Optional[int] = None, deadline: Optional[float] = None) -> None:
+        if not self.enabled:
+            return
+        priority, deadline = self._resolve(priority, deadline)
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+
+        def wake() -> None:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+        w = _Waiter(priority, next(self._seq), wake)
+        try:
+            while True:
+                if self.store is None:
+                    delay = self._locked_step(w, deadline)
+                else:
+                    # The shared level is a SQLite transaction that can wait on other workers
+                    delay = await loop.run_in_executor(self.store.executor, self._locked_step, w, deadline)
+                if delay is None:
+                    return
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except asyncio.CancelledError:
+            with self._lock:
+                self._remove(w)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        level = None if self.store is None else self.store.bucket_level(self.name, self.rate, self.capacity)
+        with self._lock:
+            if level is None:
+                self._refill(time.monotonic())
+            else:
+                self.tokens = level
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for w in self._heap:
+                queued[PRIORITY_NAMES[w.priority]] += 1
+            return {
+                "name": self.name,
+                "enabled": self.enabled,
+                "rate_per_min": round(self.rate * 60.0, 2),
+                "capacity": self.capacity,
+                "tokens": round(self.tokens, 2),
+                "queued": queued,
+                "granted": self.granted,
+                "shed": self.shed,
+                "avg_wait_ms": round(self.wait_total / self.granted * 1000.0, 2) if self.granted else 0.0,
+                "max_wait_ms": round(self.wait_max * 1000.0, 2),
+            }
+
+
+class RateLimiter:
+    """Named buckets, created on first use."""
+
+    def __init__(self):
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, name: str, rate_per_minute: float, service_wide: bool = False) -> TokenBucket:
+        b = self._buckets.get(name)
+        if b is None:
+            with self._lock:
+                b = self._buckets.get(name)
+                if b is None:
+                    b = self._buckets[name] = TokenBucket(name, rate_per_minute, service_wide=service_wide,
+                                                          store=shared_store if RATE_SHARED else None)
+        return b
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [b.stats() for b in list(self._buckets.values())]
+
+
+limiter = RateLimiter()
+_model_rates = _parse_rates(GEMINI_MODEL_RATES)
+
+
+def owm_bucket() -> TokenBucket:
+    return limiter.bucket("owm", OWM_RATE_PER_MIN, service_wide=True)
+
+
+def acquire_gemini(model_name: str, deadline: Optional[float] = None) -> None:
+    """Take a token from the model's bucket, then the shared Gemini bucket.
+
+    If the shared bucket sheds, the model's token is refunded so that
+    model's quota (and its routing) isn't charged for a call that never ran.
+    """
+    model_bucket = limiter.bucket(f"gemini:{model_name}", _model_rates.get(model_name, GEMINI_MODEL_RATE_PER_MIN))
+    model_bucket.acquire(deadline=deadline)
+    try:
+        limiter.bucket("gemini", GEMINI_RATE_PER_MIN, service_wide=True).acquire(deadline=deadline)
+    except BaseException:
+        model_bucket.refund()
+        raise
+
+
+def _collect_queue_metrics():
+    stats = limiter.stats()
+    yield from render_family("maya_ratelimit_queue_depth", "Requests waiting for a token", "gauge",
+                             [({"bucket": s["name"], "priority": p}, n) for s in stats for p, n in s["queued"].items()])
+    yield from render_family("maya_ratelimit_tokens", "Tokens currently available", "gauge",
+                             [({"bucket": s["name"]}, s["tokens"]) for s in stats])
+
+
+REGISTRY.register_collector(_collect_queue_metrics)
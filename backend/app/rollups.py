@@ -0,0 +1,313 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from .cities import city_matcher
+from .database import SessionLocal, engine
+from .models import Query, WeatherLog, WeatherHourly, WeatherDaily, ConditionHourly, ConditionDaily
+
+logger = logging.getLogger(__name__)
+
+# Raw queries/weather_logs rows older than this are deleted; 0 keeps them forever.
+# Keep it above NOWCAST_HISTORY_HOURS, the nowcaster reads that much raw history on startup
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "30"))
+# Hourly rollups older than this are deleted; daily rollups are kept
+ROLLUP_HOURLY_RETENTION_DAYS = float(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", "90"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+# Rows per DELETE, so pruning never holds the write lock for long
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "5000"))
+
+# Bound parameters per multi-row upsert; old SQLite builds allow 999 per statement
+_UPSERT_PARAMS = 900
+
+
+def _hour(d: datetime) -> datetime:
+    return d.replace(minute=0, second=0, microsecond=0)
+
+
+def _day(d: datetime) -> datetime:
+    return d.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+_PERIODS = (
+    (WeatherHourly, ConditionHourly, _hour),
+    (WeatherDaily, ConditionDaily, _day),
+)
+
+
+def rollup_city(name: str) -> str:
+    """Key a city is rolled up and looked up under: the canonical name, else the name title-cased."""
+    return city_matcher.canonical(name) or " ".join(name.split()).title()
+
+
+def bucket_start(period: str, when: datetime) -> datetime:
+    return _day(when) if period == "day" else _hour(when)
+
+
+def _chunks(rows: List[Dict[str, Any]]) -> Iterable[List[Dict[str, Any]]]:
+    size = max(1, _UPSERT_PARAMS // len(rows[0]))
+    for off in range(0, len(rows), size):
+        yield rows[off:off + size]
+
+
+def _dialect_insert():
+    name = engine.dialect.name
+    if name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None, None, None
+    # SQLite's two-argument min()/max() are scalar; Postgres calls them least()/greatest()
+    lo, hi = (func.min, func.max) if name == "sqlite" else (func.least, func.greatest)
+    return insert, lo, hi
+
+
+_insert, _lo, _hi = _dialect_insert()
+
+
+def _aggregate(weather_rows: Iterable[Dict[str, Any]], query_rows: Iterable[Dict[str, Any]], bucket_of) -> Tuple[Dict, Dict]:
+    """Fold raw rows into {(city, bucket): stats} and {(city, bucket, condition): count}."""
+    stats: Dict[Tuple[str, datetime], Dict[str, Any]] = {}
+    conditions: Dict[Tuple[str, datetime, str], int] = {}
+    names: Dict[str, str] = {}
+
+    def key_of(raw: str) -> str:
+        # Weather rows carry OWM's name, query rows whatever the client sent; both roll up under one key
+        name = names.get(raw)
+        if name is None:
+            name = names[raw] = rollup_city(raw)
+        return name
+
+    def slot(city: str, when: datetime) -> Dict[str, Any]:
+        key = (key_of(city), bucket_of(when))
+        s = stats.get(key)
+        if s is None:
+            s = stats[key] = {"samples": 0, "temp_min": None, "temp_max": None, "temp_sum": 0.0,
+                              "humidity_min": None, "humidity_max": None, "humidity_sum": 0.0, "queries": 0}
+        return s
+
+    for r in weather_rows:
+        if not r.get("city") or r.get("date") is None or r.get("temp") is None or r.get("humidity") is None:
+            continue
+        s = slot(r["city"], r["date"])
+        t, h = float(r["temp"]), float(r["humidity"])
+        s["samples"] += 1
+        s["temp_sum"] += t
+        s["humidity_sum"] += h
+        s["temp_min"] = t if s["temp_min"] is None else min(s["temp_min"], t)
+        s["temp_max"] = t if s["temp_max"] is None else max(s["temp_max"], t)
+        s["humidity_min"] = h if s["humidity_min"] is None else min(s["humidity_min"], h)
+        s["humidity_max"] = h if s["humidity_max"] is None else max(s["humidity_max"], h)
+        if r.get("condition"):
+            key = (key_of(r["city"]), bucket_of(r["date"]), r["condition"])
+            conditions[key] = conditions.get(key, 0) + 1
+    for r in query_rows:
+        if r.get("city") and r.get("timestamp") is not None:
+            slot(r["city"], r["timestamp"])["queries"] += 1
+    return stats, conditions
+
+
+def _upsert_stats(db: Session, model: Type, stats: Dict) -> None:
+    if not stats:
+        return
+    t = model.__table__
+    rows = [{"city": city, "bucket": bucket, **s} for (city, bucket), s in stats.items()]
+    for chunk in _chunks(rows):
+        stmt = _insert(t).values(chunk)
+        ex = stmt.excluded
+
+        def lo(col: str):
+            return _lo(func.coalesce(t.c[col], ex[col]), func.coalesce(ex[col], t.c[col]))
+
+        def hi(col: str):
+            return _hi(func.coalesce(t.c[col], ex[col]), func.coalesce(ex[col], t.c[col]))
+
+        db.execute(stmt.on_conflict_do_update(index_elements=["city", "bucket"], set_={
+            "samples": t.c.samples + ex.samples,
+            "temp_min": lo("temp_min"),
+            "temp_max": hi("temp_max"),
+            "temp_sum": t.c.temp_sum + ex.temp_sum,
+            "humidity_min": lo("humidity_min"),
+            "humidity_max": hi("humidity_max"),
+            "humidity_sum": t.c.humidity_sum + ex.humidity_sum,
+            "queries": t.c.queries + ex.queries,
+        }))
+
+
+def _upsert_conditions(db: Session, model: Type, conditions: Dict) -> None:
+    if not conditions:
+        return
+    t = model.__table__
+    rows = [{"city": c, "bucket": b, "condition": cond, "count": n} for (c, b, cond), n in conditions.items()]
+    for chunk in _chunks(rows):
+        stmt = _insert(t).values(chunk)
+        db.execute(stmt.on_conflict_do_update(index_elements=["city", "bucket", "condition"], set_={"count": t.c.count + stmt.excluded.count}))
+
+
+def apply_rollups(db: Session, grouped: Dict[Type, List[Dict[str, Any]]]) -> None:
+    """Add a batch of new WeatherLog/Query rows to the hourly and daily rollups.
+
+    Runs inside the caller's transaction, so the raw rows and their rollups
+    commit together. Each bucket is updated by an atomic upsert, which keeps
+    it correct when several workers flush at once. Cities are keyed by
+    rollup_city(), so aliases and case variants share one history.
+    """
+    if _insert is None:
+        return
+    weather_rows = grouped.get(WeatherLog, [])
+    query_rows = grouped.get(Query, [])
+    if not weather_rows and not query_rows:
+        return
+    for stats_model, condition_model, bucket_of in _PERIODS:
+        stats, conditions = _aggregate(weather_rows, query_rows, bucket_of)
+        _upsert_stats(db, stats_model, stats)
+        _upsert_conditions(db, condition_model, conditions)
+
+
+def rebuild_rollups(batch: int = 1000) -> int:
+    """Recompute every rollup from the raw tables (one-off backfill); returns raw rows read."""
+    total = 0
+    with SessionLocal() as db:
+        for model in (WeatherHourly, WeatherDaily, ConditionHourly, ConditionDaily):
+            db.execute(delete(model))
+        for model, columns in ((WeatherLog, ("city", "temp", "humidity", "condition", "date")), (Query, ("city", "timestamp"))):
+            last_id = 0
+            while True:
+                rows = db.execute(select(model.id, *(getattr(model, c) for c in columns))
+                                  .where(model.id > last_id).order_by(model.id).limit(batch)).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                apply_rollups(db, {model: [r._asdict() for r in rows]})
+                total += len(rows)
+        db.commit()
+    return total
+
+
+def _mean(total: Optional[float], n: int) -> Optional[float]:
+    return round(total / n, 2) if n and total is not None else None
+
+
+def history_points(stats_rows, condition_rows) -> List[Dict[str, Any]]:
+    conditions: Dict[datetime, Dict[str, int]] = {}
+    for r in condition_rows:
+        conditions.setdefault(r.bucket, {})[r.condition] = r.count
+    return [{
+        "bucket": r.bucket.replace(tzinfo=timezone.utc).isoformat(),
+        "samples": r.samples,
+        "temp_min": r.temp_min,
+        "temp_max": r.temp_max,
+        "temp_mean": _mean(r.temp_sum, r.samples),
+        "humidity_min": r.humidity_min,
+        "humidity_max": r.humidity_max,
+        "humidity_mean": _mean(r.humidity_sum, r.samples),
+        "queries": r.queries,
+        "conditions": conditions.get(r.bucket, {}),
+    } for r in stats_rows]
+
+
+def period_models(period: str) -> Tuple[Type, Type]:
+    return (WeatherDaily, ConditionDaily) if period == "day" else (WeatherHourly, ConditionHourly)
+
+
+def _prune(db: Session, model: Type, column, cutoff: datetime) -> int:
+    """Delete rows with column < cutoff; tables with an id go RETENTION_BATCH rows per transaction."""
+    if not hasattr(model, "id"):
+        n = db.execute(delete(model).where(column < cutoff)).rowcount or 0
+        db.commit()
+        return n
+    removed = 0
+    while True:
+        ids = select(model.id).where(column < cutoff).limit(RETENTION_BATCH).scalar_subquery()
+        n = db.execute(delete(model).where(model.id.in_(ids))).rowcount or 0
+        db.commit()
+        removed += n
+        if n < RETENTION_BATCH:
+            return removed
+
+
+class RetentionJob:
+    """Periodically deletes raw rows past RETENTION_DAYS and hourly rollups past their window."""
+
+    def __init__(self, interval: float = RETENTION_INTERVAL):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.deleted: Dict[str, int] = {}
+        self.last_run: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def prune_once(self) -> Dict[str, int]:
+        now = datetime.utcnow()
+        removed: Dict[str, int] = {}
+        with SessionLocal() as db:
+            if RETENTION_DAYS > 0:
+                cutoff = now - timedelta(days=RETENTION_DAYS)
+                removed["weather_logs"] = _prune(db, WeatherLog, WeatherLog.date, cutoff)
+                removed["queries"] = _prune(db, Query, Query.timestamp, cutoff)
+            if ROLLUP_HOURLY_RETENTION_DAYS > 0:
+                cutoff = now - timedelta(days=ROLLUP_HOURLY_RETENTION_DAYS)
+                removed["weather_hourly"] = _prune(db, WeatherHourly, WeatherHourly.bucket, cutoff)
+                removed["condition_hourly"] = _prune(db, ConditionHourly, ConditionHourly.bucket, cutoff)
+        for k, n in removed.items():
+            self.deleted[k] = self.deleted.get(k, 0) + n
+        self.runs += 1
+        self.last_run = time.time()
+        return removed
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.prune_once)
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e) or e.__class__.__name__
+                logger.warning("retention prune failed: %s", self.last_error)
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None and (RETENTION_DAYS > 0 or ROLLUP_HOURLY_RETENTION_DAYS > 0):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "retention_days": RETENTION_DAYS,
+            "hourly_retention_days": ROLLUP_HOURLY_RETENTION_DAYS,
+            "runs": self.runs,
+            "deleted": dict(self.deleted),
+            "last_run": datetime.fromtimestamp(self.last_run, timezone.utc).isoformat() if self.last_run else None,
+            "last_error": self.last_error,
+        }
+
+
+retention = RetentionJob()
+
+
+if __name__ == "__main__":
+    # python -m app.rollups rebuild   (fill the rollups from rows written before they existed)
+    if sys.argv[1:] == ["rebuild"]:
+        from .database import init_schema
+        init_schema()
+        print(f"rolled up {rebuild_rollups()} rows")
+    else:
+        print("usage: python -m app.rollups rebuild")
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict
 
 class Bilingual(BaseModel):
     english: str
@@ -13,6 +13,8 @@ class WeatherOut(BaseModel):
     humidity: float
     condition: str
     rain_chance: Optional[float] = None
+    # Set when the reading is not a live observation: "nowcast" or "stub"
+    source: Optional[str] = None
     bilingual: Bilingual
 
 class WeatherIn(BaseModel):
@@ -24,6 +26,8 @@ class VoiceIn(BaseModel):
 
 class RouteIn(BaseModel):
     cities: List[str]
+    # Seconds for the whole request; /api/route/stream returns cities still pending at this point degraded
+    deadline: Optional[float] = None
 
 class MoodIn(BaseModel):
     text: str
@@ -36,6 +40,35 @@ class RouteOut(BaseModel):
     results: List[WeatherOut]
 
 
+class WeatherBatchIn(BaseModel):
+    # Names as sent, duplicates and aliases included; distinct cities are capped by WEATHER_BATCH_MAX_CITIES
+    cities: List[str] = Field(..., max_length=2000)
+    # Map layers only need the numbers; set this to also get bilingual text per city
+    include_text: bool = False
+    deadline: Optional[float] = None
+
+
+class WeatherBatchItem(BaseModel):
+    city: str
+    temp: float
+    humidity: float
+    condition: str
+    rain_chance: Optional[float] = None
+    source: Optional[str] = None
+    # Request names that resolved to this city
+    names: List[str]
+    # Served from the warmer snapshot or weather cache, without an upstream call
+    cached: bool
+    bilingual: Optional[Bilingual] = None
+
+
+class WeatherBatchOut(BaseModel):
+    results: List[WeatherBatchItem]
+    requested: int
+    unique: int
+    fetched: int
+
+
 class KeyStatus(BaseModel):
     configured: bool
     reachable: bool
@@ -53,8 +86,22 @@ class GeminiModelInfo(BaseModel):
     supports_generate: bool
 
 
+class ModelHealthInfo(BaseModel):
+    id: str
+    state: str
+    successes: int
+    failures: int
+    error_rate: float
+    latency_ms: Optional[float] = None
+    retry_in: float
+    last_error: Optional[str] = None
+
+
 class GeminiModelsOut(BaseModel):
     models: List[GeminiModelInfo]
+    router: List[ModelHealthInfo] = []
+    # Hedged requests: "fired" and "won" (the hedge answered first)
+    hedges: Dict[str, int] = {}
 
 
 class ChatIn(BaseModel):
@@ -85,3 +132,142 @@ class PreferenceOut(BaseModel):
     notification_time: str
     voice_enabled: bool
     assistant_name: str
+
+
+class PreferenceBulkIn(BaseModel):
+    # The scheduler pages through users in chunks of at most this size
+    ids: List[str] = Field(..., max_length=1000)
+
+
+class PreferenceBulkOut(BaseModel):
+    preferences: List[PreferenceOut]
+
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    # "memory" (per worker) or "sqlite" (shared by all workers on the host)
+    backend: str = "memory"
+    ttl: float
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+
+
+class CacheStatsOut(BaseModel):
+    weather: CacheStats
+    gemini: CacheStats
+    preferences: CacheStats
+
+
+class WriterStatsOut(BaseModel):
+    pending: int
+    max_rows: int
+    policy: str
+    enqueued: int
+    written: int
+    dropped: int
+    failed: int
+    flushes: int
+    last_flush_ms: float
+
+
+class NowcastCity(BaseModel):
+    city: str
+    temp: float
+    humidity: float
+    rain_chance: float
+    observations: int
+    age_minutes: float
+
+class NowcastStatus(BaseModel):
+    enabled: bool
+    cities: int
+    rows_ingested: int
+    refreshes: int
+    last_refresh: Optional[str] = None
+    last_error: Optional[str] = None
+
+class NowcastOut(BaseModel):
+    status: NowcastStatus
+    predictions: List[NowcastCity]
+
+class RateLimitBucket(BaseModel):
+    name: str
+    enabled: bool
+    rate_per_min: float
+    capacity: float
+    tokens: float
+    queued: Dict[str, int]
+    granted: int
+    shed: int
+    avg_wait_ms: float
+    max_wait_ms: float
+
+class RateLimitStatsOut(BaseModel):
+    buckets: List[RateLimitBucket]
+
+class WarmerStatusOut(BaseModel):
+    running: bool
+    cities: int
+    known_ids: int
+    fresh: int
+    refreshes: int
+    upstream_calls: int
+    last_refresh: Optional[str] = None
+    last_duration_ms: Optional[float] = None
+    interval: float
+    stale_after: float
+    last_error: Optional[str] = None
+
+class HistoryPoint(BaseModel):
+    bucket: str  # start of the hour/day, ISO 8601 UTC
+    samples: int
+    temp_min: Optional[float] = None
+    temp_max: Optional[float] = None
+    temp_mean: Optional[float] = None
+    humidity_min: Optional[float] = None
+    humidity_max: Optional[float] = None
+    humidity_mean: Optional[float] = None
+    queries: int
+    conditions: Dict[str, int] = {}
+
+class HistoryOut(BaseModel):
+    city: str
+    period: str
+    points: List[HistoryPoint]
+
+class RetentionStatusOut(BaseModel):
+    running: bool
+    retention_days: float
+    hourly_retention_days: float
+    runs: int
+    deleted: Dict[str, int]
+    last_run: Optional[str] = None
+    last_error: Optional[str] = None
+
+class StartupOut(BaseModel):
+    # import, db, sdk, http, ready; a phase is missing until it has run
+    phases_ms: Dict[str, float]
+
+class ProfilerIn(BaseModel):
+    # Fraction of requests to profile; 0 switches sampling off
+    rate: float = Field(..., ge=0, le=1)
+    # Seconds until sampling switches itself off; defaults to PROFILE_DEFAULT_DURATION
+    duration: Optional[float] = Field(None, gt=0)
+    # Path prefixes to sample, e.g. ["/api/weather"]; empty means every route
+    routes: List[str] = []
+
+class ProfilerStatusOut(BaseModel):
+    enabled: bool
+    rate: float
+    routes: List[str]
+    expires_in: Optional[float] = None
+    interval_ms: float
+    active: int
+    profiled: int
+    samples: int
+    ring_size: int
+    # Profiled requests currently in the ring, by "METHOD route"
+    ring: Dict[str, int]
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Hashable, Optional, Tuple
+
+from .cache import CacheBackend, _MISSING
+
+# "memory": every worker has its own caches. "sqlite": all workers on the host share CACHE_SHARED_PATH
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory").lower()
+CACHE_SHARED_PATH = os.getenv("CACHE_SHARED_PATH", os.path.join(tempfile.gettempdir(), "maya-shared-cache.db"))
+# Token buckets draw from one budget per host instead of one per worker
+RATE_SHARED = os.getenv("RATE_SHARED", "1" if CACHE_BACKEND == "sqlite" else "0").lower() in ("1", "true", "yes")
+# Values at least this many bytes (as compact JSON) are zlib-compressed
+SHARED_COMPRESS_MIN = int(os.getenv("SHARED_COMPRESS_MIN", "512"))
+# Over-capacity entries are trimmed once every this many writes per namespace
+SHARED_TRIM_EVERY = 64
+# Threads that run store calls for coroutines, so SQLite I/O and lock waits stay off the event loop
+SHARED_IO_WORKERS = int(os.getenv("SHARED_IO_WORKERS", "4"))
+
+
+def _pack(value: Any) -> bytes:
+    data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) >= SHARED_COMPRESS_MIN:
+        return b"z" + zlib.compress(data)
+    return b"j" + data
+
+
+def _unpack(blob: bytes) -> Any:
+    data = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(data)
+
+
+class SharedStore:
+    """One SQLite file per host holding cache entries and token bucket levels.
+
+    Every worker opens its own connection. Updates are single statements
+    or BEGIN IMMEDIATE transactions, so they are atomic across processes.
+    Entries are kept with a wall-clock expiry since monotonic clocks are
+    not comparable between processes. Durability doesn't matter here
+    (synchronous=OFF); losing the file only costs a cold cache.
+    Every call blocks, so async code runs them on `executor`.
+    """
+
+    def __init__(self, path: str = CACHE_SHARED_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self.executor = ThreadPoolExecutor(max_workers=max(1, SHARED_IO_WORKERS), thread_name_prefix="shared-store")
+
+    def _db(self) -> sqlite3.Connection:
+        # Caller must hold the lock. A forked worker must not reuse its parent's connection
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries (ns TEXT NOT NULL, key TEXT NOT NULL, expires REAL NOT NULL,"
+                " value BLOB NOT NULL, PRIMARY KEY (ns, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_expires ON cache_entries (ns, expires)")
+            conn.execute("CREATE TABLE IF NOT EXISTS token_buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    # Cache entries
+
+    def get(self, ns: str, key: str) -> Tuple[Any, float]:
+        with self._lock:
+            row = self._db().execute("SELECT expires, value FROM cache_entries WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+        if row is None:
+            return _MISSING, 0.0
+        return _unpack(row[1]), row[0] - time.time()
+
+    def set(self, ns: str, key: str, value: Any, ttl: float) -> None:
+        blob = _pack(value)
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO cache_entries (ns, key, expires, value) VALUES (?, ?, ?, ?)",
+                               (ns, key, time.time() + ttl, blob))
+
+    def set_newer(self, ns: str, key: str, value: Any, ttl: float) -> bool:
+        """set() for a [version, payload] value, skipped if the stored entry has a higher version; returns whether it was written."""
+        blob = _pack(value)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT value FROM cache_entries WHERE ns = ? AND key = ?", (ns, key)).fetchone()
+                old = None if row is None else _unpack(row[0])
+                # Entries written by plain set() carry no version and are always replaced
+                written = not isinstance(old, list) or old[0] <= value[0]
+                if written:
+                    db.execute("INSERT OR REPLACE INTO cache_entries (ns, key, expires, value) VALUES (?, ?, ?, ?)",
+                               (ns, key, time.time() + ttl, blob))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return written
+
+    def trim(self, ns: str, maxsize: int) -> int:
+        """Keep the maxsize entries that expire last (roughly the newest); returns how many were dropped."""
+        with self._lock:
+            cur = self._db().execute(
+                "DELETE FROM cache_entries WHERE ns = ? AND key IN"
+                " (SELECT key FROM cache_entries WHERE ns = ? ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (ns, ns, maxsize),
+            )
+            return cur.rowcount
+
+    def delete(self, ns: str, key: str) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM cache_entries WHERE ns = ? AND key = ?", (ns, key))
+
+    def clear(self, ns: str) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM cache_entries WHERE ns = ?", (ns,))
+
+    def count(self, ns: str) -> int:
+        with self._lock:
+            return self._db().execute("SELECT COUNT(*) FROM cache_entries WHERE ns = ?", (ns,)).fetchone()[0]
+
+    # Token buckets
+
+    def _level(self, db: sqlite3.Connection, name: str, rate: float, capacity: float, now: float) -> float:
+        row = db.execute("SELECT tokens, updated FROM token_buckets WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return capacity
+        return min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+
+    def bucket_level(self, name: str, rate: float, capacity: float) -> float:
+        with self._lock:
+            return self._level(self._db(), name, rate, capacity, time.time())
+
+    def bucket_take(self, name: str, rate: float, capacity: float, need: float) -> Tuple[bool, float]:
+        """Atomically take one token if at least `need` are available; returns (taken, tokens left)."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                tokens = self._level(db, name, rate, capacity, now)
+                taken = tokens >= need
+                if taken:
+                    tokens -= 1.0
+                    db.execute("INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return taken, tokens
+
+    def bucket_refund(self, name: str, rate: float, capacity: float) -> float:
+        """Atomically put one token back (up to capacity); returns the new level."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                tokens = min(capacity, self._level(db, name, rate, capacity, now) + 1.0)
+                db.execute("INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return tokens
+
+
+shared_store = SharedStore()
+
+
+class SQLiteBackend(CacheBackend):
+    """CacheBackend over the host-wide SharedStore; one namespace per cache."""
+
+    name = "sqlite"
+
+    def __init__(self, namespace: str, maxsize: int = 256, store: SharedStore = shared_store):
+        self.namespace = namespace
+        self.maxsize = max(1, int(maxsize))
+        self.store = store
+        self.executor = store.executor
+        self._writes = 0
+
+    def get(self, key: Hashable, touch: bool = True) -> Tuple[Any, float]:
+        return self.store.get(self.namespace, str(key))
+
+    def set(self, key: Hashable, value: Any, ttl: float) -> int:
+        self.store.set(self.namespace, str(key), value, ttl)
+        return self._wrote()
+
+    def set_newer(self, key: Hashable, value: Any, ttl: float) -> int:
+        if not self.store.set_newer(self.namespace, str(key), value, ttl):
+            return 0
+        return self._wrote()
+
+    def _wrote(self) -> int:
+        self._writes += 1
+        if self._writes % SHARED_TRIM_EVERY == 0:
+            return self.store.trim(self.namespace, self.maxsize)
+        return 0
+
+    def delete(self, key: Hashable) -> None:
+        self.store.delete(self.namespace, str(key))
+
+    def clear(self) -> None:
+        self.store.clear(self.namespace)
+
+    def size(self) -> int:
+        return self.store.count(self.namespace)
+
+
+def make_backend(namespace: str, maxsize: int) -> Optional[CacheBackend]:
+    """Backend for a named cache per CACHE_BACKEND; None means TTLCache's default (memory)."""
+    if CACHE_BACKEND == "sqlite":
+        return SQLiteBackend(namespace, maxsize)
+    return None
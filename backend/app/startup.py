@@ -0,0 +1,44 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+
+class StartupTimer:
+    """Wall time of each startup phase, for spotting slow worker boots.
+
+    Phases: "import" (the app package up to the end of main.py), "db"
+    (schema setup in the lifespan hook), "sdk" (google.generativeai import
+    and configure, normally warmed in the background), "http" (OWM client)
+    and "ready" (package import to the first request being accepted).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.phases[name] = round(seconds * 1000.0, 1)
+
+    def since_start(self, name: str) -> None:
+        self.record(name, time.perf_counter() - self.started)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - t)
+
+    def get(self, name: str) -> Optional[float]:
+        return self.phases.get(name)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"phases_ms": dict(self.phases)}
+
+
+startup = StartupTimer()
@@ -0,0 +1,217 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from . import weather
+from .cache import normalize_key
+from .metrics import OWM_LATENCY
+from .ratelimit import BACKGROUND, owm_bucket, set_priority
+
+logger = logging.getLogger(__name__)
+
+WARMER_ENABLED = os.getenv("WARMER_ENABLED", "1").lower() in ("1", "true", "yes")
+WARMER_INTERVAL = float(os.getenv("WARMER_INTERVAL", "600"))
+# Each sleep is WARMER_INTERVAL * (1 ± WARMER_JITTER) so workers don't refresh in lockstep
+WARMER_JITTER = float(os.getenv("WARMER_JITTER", "0.1"))
+# Snapshot entries older than this are ignored by readers
+WARMER_STALE_AFTER = float(os.getenv("WARMER_STALE_AFTER", "1800"))
+WARMER_CONCURRENCY = int(os.getenv("WARMER_CONCURRENCY", "4"))
+
+# OWM's group endpoint accepts at most 20 city IDs per call
+OWM_GROUP_MAX = 20
+OWM_GROUP_BASE = weather.OWM_BASE.rsplit("/", 1)[0] + "/group"
+
+
+def _parse_city_ids(spec: str) -> Dict[str, int]:
+    """Parse OWM_CITY_IDS, e.g. "Chennai=1264527,Madurai=1264521"."""
+    ids: Dict[str, int] = {}
+    for part in spec.split(","):
+        name, _, cid = part.partition("=")
+        if name.strip() and cid.strip().isdigit():
+            ids[normalize_key(name)] = int(cid)
+    return ids
+
+
+class WeatherWarmer:
+    """Keeps a snapshot of shaped weather for a fixed city list.
+
+    Cities with a known OWM ID are refreshed through the group endpoint,
+    up to 20 per call. The rest are fetched by name once, and the ID in
+    that response is remembered, so from the second cycle on the whole
+    list costs ceil(N / 20) upstream calls. Each refresh also seeds the
+    weather cache. Readers use get(), which never blocks on the network.
+    """
+
+    def __init__(self, cities: List[str], interval: float = WARMER_INTERVAL, jitter: float = WARMER_JITTER,
+                 stale_after: float = WARMER_STALE_AFTER):
+        self.cities = list(cities)
+        self.interval = interval
+        self.jitter = jitter
+        self.stale_after = stale_after
+        self._ids: Dict[str, int] = _parse_city_ids(os.getenv("OWM_CITY_IDS", ""))
+        # normalized city -> (shaped, fetched_at); replaced wholesale so reads need no lock
+        self._snapshot: Dict[str, tuple] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.refreshes = 0
+        self.upstream_calls = 0
+        self.last_refresh: Optional[float] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def get(self, city: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        item = self._snapshot.get(normalize_key(city))
+        if item is None:
+            return None
+        shaped, fetched_at = item
+        if not allow_stale and time.time() - fetched_at > self.stale_after:
+            return None
+        return shaped
+
+    async def _fetch_group(self, ids: List[int]) -> List[Dict[str, Any]]:
+        await owm_bucket().aacquire()
+        client = await weather.get_async_client()
+        params = {"id": ",".join(str(i) for i in ids), "appid": weather.OWM_KEY, "units": "metric"}
+        started = time.perf_counter()
+        try:
+            r = await client.get(OWM_GROUP_BASE, params=params)
+            r.raise_for_status()
+            data = r.json().get("list", [])
+        except Exception:
+            OWM_LATENCY.labels("group", "error").observe(time.perf_counter() - started)
+            raise
+        OWM_LATENCY.labels("group", "ok").observe(time.perf_counter() - started)
+        return data
+
+    def learn_id(self, city: str, raw: Dict[str, Any]) -> None:
+        """Remember the OWM ID from a by-name reply so the city can join group fetches."""
+        if isinstance(raw.get("id"), int) and not raw.get("source"):
+            self._ids[normalize_key(city)] = raw["id"]
+
+    async def fetch_known(self, cities: List[str], errors: Optional[List[str]] = None, sem: Optional[asyncio.Semaphore] = None,
+                          deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Raw observations for the cities whose OWM ID is known, 20 per upstream call.
+
+        The calls run concurrently, `sem` (default WARMER_CONCURRENCY) at a
+        time, and any still running at `deadline` (time.monotonic()) are
+        dropped. Cities without a known ID (or missing from the reply) are
+        left out; every observation returned is also written to the weather cache.
+        """
+        fresh: Dict[str, Dict[str, Any]] = {}
+        if not weather.OWM_KEY:
+            return fresh
+        by_id = {self._ids[normalize_key(c)]: c for c in cities if normalize_key(c) in self._ids}
+        id_list = list(by_id)
+        sem = sem or asyncio.Semaphore(WARMER_CONCURRENCY)
+
+        def note(message: str) -> None:
+            if errors is not None:
+                errors.append(f"group: {message}")
+
+        async def group(chunk: List[int]) -> None:
+            async with sem:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    note("deadline passed")
+                    return
+                self.upstream_calls += 1
+                try:
+                    reply = await asyncio.wait_for(self._fetch_group(chunk), remaining)
+                except asyncio.TimeoutError:
+                    note("deadline passed")
+                    return
+                except Exception as e:
+                    note(str(e))
+                    return
+            for raw in reply:
+                city = by_id.get(raw.get("id"))
+                if city is not None:
+                    fresh[city] = raw
+                    await weather.weather_cache.aset(normalize_key(city), raw)
+
+        await asyncio.gather(*(group(id_list[off:off + OWM_GROUP_MAX]) for off in range(0, len(id_list), OWM_GROUP_MAX)))
+        return fresh
+
+    async def refresh_once(self) -> int:
+        """Refresh every city; returns how many snapshot entries were updated."""
+        started = time.perf_counter()
+        errors: List[str] = []
+        fresh = await self.fetch_known(self.cities, errors)
+
+        # Cities with no known ID yet (or missing from the group reply) go by name
+        sem = asyncio.Semaphore(WARMER_CONCURRENCY)
+
+        async def by_name(city: str):
+            async with sem:
+                try:
+                    self.upstream_calls += 1
+                    raw = await weather._fetch_weather_upstream_async(city)
+                except Exception as e:
+                    errors.append(f"{city}: {e}")
+                    return
+                fresh[city] = raw
+                await weather.weather_cache.aset(normalize_key(city), raw)
+                self.learn_id(city, raw)
+
+        await asyncio.gather(*(by_name(c) for c in self.cities if c not in fresh))
+
+        now = time.time()
+        snapshot = dict(self._snapshot)
+        for city, raw in fresh.items():
+            shaped = weather.shape_basic_weather(raw)
+            snapshot[normalize_key(city)] = (shaped, now)
+            # Regular observations for every city are what the nowcaster learns from
+            await weather.log_observation(raw)
+        self._snapshot = snapshot
+
+        self.refreshes += 1
+        self.last_refresh = now
+        self.last_duration_ms = (time.perf_counter() - started) * 1000.0
+        self.last_error = "; ".join(errors)[:500] or None
+        return len(fresh)
+
+    async def _run(self) -> None:
+        # Refreshes queue behind user traffic for the OWM quota
+        set_priority(BACKGROUND)
+        while True:
+            try:
+                await self.refresh_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("weather warmer refresh failed")
+            delay = self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(1.0, delay))
+
+    def start(self) -> None:
+        if self._task is None and WARMER_ENABLED and weather.OWM_KEY:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        fresh = sum(1 for _, at in self._snapshot.values() if now - at <= self.stale_after)
+        return {
+            "running": self._task is not None,
+            "cities": len(self.cities),
+            "known_ids": sum(1 for c in self.cities if normalize_key(c) in self._ids),
+            "fresh": fresh,
+            "refreshes": self.refreshes,
+            "upstream_calls": self.upstream_calls,
+            "last_refresh": datetime.fromtimestamp(self.last_refresh, tz=timezone.utc).isoformat() if self.last_refresh else None,
+            "last_duration_ms": None if self.last_duration_ms is None else round(self.last_duration_ms, 1),
+            "interval": self.interval,
+            "stale_after": self.stale_after,
+            "last_error": self.last_error,
+        }
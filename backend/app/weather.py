@@ -1,28 +1,112 @@
 import os
-import requests
-from typing import Dict, Any
-from dotenv import load_dotenv
+import time
+import asyncio
+import httpx
+from typing import Dict, Any, Optional
 
-# Ensure .env is loaded before reading environment variables
-load_dotenv()
+from .cache import TTLCache, normalize_key
+from .metrics import OWM_LATENCY, register_cache
+from .shared import make_backend
+from .nowcast import nowcaster
+from .ratelimit import owm_bucket
+from .writer import alog_weather
 
-OWM_BASE = "https://api.openweathermap.org/data/2.5/weather"
+# Overridable so benchmarks can point at a local stand-in
+OWM_BASE = os.getenv("OWM_BASE_URL", "https://api.openweathermap.org/data/2.5/weather")
 OWM_KEY = os.getenv("OWM_API_KEY", "")
 
-# Helper to fetch weather for a city (metric units)
-def fetch_weather(city: str) -> Dict[str, Any]:
+# OWM refreshes observations roughly every 10 minutes, so a short TTL is safe
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "300"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+
+weather_cache = TTLCache(maxsize=WEATHER_CACHE_SIZE, ttl=WEATHER_CACHE_TTL, backend=make_backend("weather", WEATHER_CACHE_SIZE))
+register_cache("weather", weather_cache)
+
+# Shared keep-alive pool for the async client
+OWM_MAX_CONNECTIONS = int(os.getenv("OWM_MAX_CONNECTIONS", "20"))
+OWM_TIMEOUT = float(os.getenv("OWM_TIMEOUT", "15"))
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_lock = asyncio.Lock()
+
+# Helper to fetch weather for a city (metric units), served from the TTL cache
+async def fetch_weather_async(city: str) -> Dict[str, Any]:
+    return await weather_cache.aget_or_load(normalize_key(city), lambda: _load_weather(city))
+
+
+async def _load_weather(city: str) -> Dict[str, Any]:
+    raw = await _fetch_weather_upstream_async(city)
+    await log_observation(raw)
+    return raw
+
+
+async def log_observation(raw: Dict[str, Any]) -> None:
+    """Record a freshly fetched reading for history/rollups; call once per upstream fetch, never for cache hits."""
+    if not raw.get("source"):
+        # Only real observations go into the history the nowcaster learns from
+        shaped = shape_basic_weather(raw)
+        await alog_weather(shaped["city"], shaped["temp"], shaped["humidity"], shaped["condition"])
+
+
+def peek_weather(city: str) -> Optional[Dict[str, Any]]:
+    """Last known raw observation for a city, even if past its TTL."""
+    return weather_cache.peek(normalize_key(city))
+
+
+def fallback_weather(city: str) -> Dict[str, Any]:
+    """Best guess when OWM can't answer: the local nowcast, else the last cached reading, else the stub."""
+    return nowcaster.predict(city) or peek_weather(city) or _stub_weather(city)
+
+
+async def afallback_weather(city: str) -> Dict[str, Any]:
+    """fallback_weather() for coroutines; a shared cache backend is read off the event loop."""
+    return nowcaster.predict(city) or await weather_cache.apeek(normalize_key(city)) or _stub_weather(city)
+
+
+def _stub_weather(city: str) -> Dict[str, Any]:
+    # Deterministic stub for development if no key
+    return {
+        "name": city,
+        "main": {"temp": 31.2, "humidity": 58},
+        "weather": [{"main": "Clear", "description": "clear sky"}],
+        "rain": {"1h": 0.0},
+        "source": "stub",
+    }
+
+
+async def get_async_client() -> httpx.AsyncClient:
+    global _async_client
+    if _async_client is None:
+        async with _async_client_lock:
+            if _async_client is None:
+                limits = httpx.Limits(max_connections=OWM_MAX_CONNECTIONS, max_keepalive_connections=OWM_MAX_CONNECTIONS)
+                _async_client = httpx.AsyncClient(limits=limits, timeout=OWM_TIMEOUT)
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def _fetch_weather_upstream_async(city: str) -> Dict[str, Any]:
     if not OWM_KEY:
-        # Return deterministic stub for development if no key
-        return {
-            "name": city,
-            "main": {"temp": 31.2, "humidity": 58},
-            "weather": [{"main": "Clear", "description": "clear sky"}],
-            "rain": {"1h": 0.0}
-        }
+        return _stub_weather(city)
+    await owm_bucket().aacquire()
+    client = await get_async_client()
     params = {"q": city, "appid": OWM_KEY, "units": "metric"}
-    r = requests.get(OWM_BASE, params=params, timeout=15)
-    r.raise_for_status()
-    return r.json()
+    started = time.perf_counter()
+    try:
+        r = await client.get(OWM_BASE, params=params)
+        r.raise_for_status()
+        data = r.json()
+    except Exception:
+        OWM_LATENCY.labels("weather", "error").observe(time.perf_counter() - started)
+        raise
+    OWM_LATENCY.labels("weather", "ok").observe(time.perf_counter() - started)
+    return data
 
 def shape_basic_weather(raw: Dict[str, Any]) -> Dict[str, Any]:
     temp = float(raw.get("main", {}).get("temp", 0))
@@ -30,17 +114,29 @@ def shape_basic_weather(raw: Dict[str, Any]) -> Dict[str, Any]:
     condition = raw.get("weather", [{}])[0].get("description", "Unknown")
     city = raw.get("name") or "Unknown"
     rain_1h = raw.get("rain", {}).get("1h", 0.0)
-    rain_chance = 70.0 if rain_1h and rain_1h > 0 else 10.0 if "cloud" in condition.lower() else 0.0
-    return {
+    rain_chance = raw.get("rain_chance")  # set by the nowcaster
+    if rain_chance is None:
+        rain_chance = 70.0 if rain_1h and rain_1h > 0 else 10.0 if "cloud" in condition.lower() else 0.0
+    shaped = {
         "city": city,
         "temp": temp,
         "humidity": humidity,
         "condition": condition.title(),
         "rain_chance": rain_chance,
     }
+    if raw.get("source"):
+        shaped["source"] = raw["source"]
+    if raw.get("dt"):
+        # OWM observation time (unix); drives Last-Modified on cacheable GETs
+        shaped["observed_at"] = raw["dt"]
+    return shaped
+
+
+def weather_cache_stats() -> Dict[str, Any]:
+    return weather_cache.stats()
 
 
-def check_openweather_key() -> Dict[str, Any]:
+async def check_openweather_key() -> Dict[str, Any]:
     """Verify OpenWeatherMap API key configuration and basic reachability.
     Returns a dict: {configured, reachable, message}
     """
@@ -50,7 +146,8 @@ def check_openweather_key() -> Dict[str, Any]:
     try:
         # Make a tiny request to validate the key. Use a common TN city.
         params = {"q": "Chennai", "appid": OWM_KEY, "units": "metric"}
-        r = requests.get(OWM_BASE, params=params, timeout=8)
+        client = await get_async_client()
+        r = await client.get(OWM_BASE, params=params, timeout=8)
         if r.status_code == 401:
             return {"configured": True, "reachable": False, "message": "Invalid OpenWeatherMap API key (401)"}
         r.raise_for_status()
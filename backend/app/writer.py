@@ -0,0 +1,205 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from sqlalchemy import insert
+
+from .database import SessionLocal
+from .models import Query, WeatherLog
+from .metrics import DB_COMMIT_LATENCY, DB_ROWS_WRITTEN, REGISTRY, render_family
+from .rollups import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_BUFFER = int(os.getenv("WRITE_BEHIND_BUFFER", "10000"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "200"))
+WRITE_BEHIND_INTERVAL = float(os.getenv("WRITE_BEHIND_INTERVAL", "1.0"))
+# What to do when the buffer is full: "drop" the row or "block" the caller
+WRITE_BEHIND_POLICY = os.getenv("WRITE_BEHIND_POLICY", "drop").lower()
+WRITE_BEHIND_BLOCK_TIMEOUT = float(os.getenv("WRITE_BEHIND_BLOCK_TIMEOUT", "0.5"))
+
+
+class WriteBehindLogger:
+    """Buffers log rows in memory and bulk-inserts them from a background thread.
+
+    A flush runs once WRITE_BEHIND_BATCH rows are pending or every
+    WRITE_BEHIND_INTERVAL seconds. Each flush is one transaction with one
+    INSERT per model, plus the rollup upserts for those rows (on_flush).
+    stop() drains whatever is still buffered.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_rows: int = WRITE_BEHIND_BUFFER, batch_size: int = WRITE_BEHIND_BATCH,
+                 interval: float = WRITE_BEHIND_INTERVAL, policy: str = WRITE_BEHIND_POLICY, block_timeout: float = WRITE_BEHIND_BLOCK_TIMEOUT,
+                 on_flush: Optional[Callable[[Any, Dict[Type, List[Dict[str, Any]]]], None]] = apply_rollups):
+        self._session_factory = session_factory
+        self._on_flush = on_flush
+        self.max_rows = max(1, max_rows)
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.policy = policy if policy in ("drop", "block") else "drop"
+        self.block_timeout = block_timeout
+        self._buf: "deque[Tuple[Type, Dict[str, Any]]]" = deque()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = 0.0
+
+    def start(self) -> None:
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+        # Anything still buffered (e.g. the thread never started) is written here
+        self.flush()
+
+    def enqueue(self, model: Type, **values: Any) -> bool:
+        """Queue one row; returns False if it was dropped because the buffer is full."""
+        with self._cond:
+            if len(self._buf) >= self.max_rows and self.policy == "block":
+                deadline = time.monotonic() + self.block_timeout
+                while len(self._buf) >= self.max_rows:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if len(self._buf) >= self.max_rows:
+                self.dropped += 1
+                return False
+            self._append(model, values)
+            return True
+
+    async def aenqueue(self, model: Type, **values: Any) -> bool:
+        """enqueue() for the event loop: waiting on a full buffer (block policy) happens in a worker thread."""
+        with self._cond:
+            if len(self._buf) < self.max_rows:
+                self._append(model, values)
+                return True
+        if self.policy == "block":
+            return await asyncio.to_thread(self.enqueue, model, **values)
+        return self.enqueue(model, **values)
+
+    def _append(self, model: Type, values: Dict[str, Any]) -> None:
+        # Caller must hold the lock
+        self._buf.append((model, values))
+        self.enqueued += 1
+        if len(self._buf) >= self.batch_size:
+            self._cond.notify_all()
+
+    def _take(self) -> List[Tuple[Type, Dict[str, Any]]]:
+        # Caller must hold the lock
+        rows = list(self._buf)
+        self._buf.clear()
+        self._cond.notify_all()  # wake producers blocked on a full buffer
+        return rows
+
+    def flush(self) -> int:
+        with self._cond:
+            rows = self._take()
+        return self._write(rows)
+
+    def _write(self, rows: List[Tuple[Type, Dict[str, Any]]]) -> int:
+        if not rows:
+            return 0
+        grouped: Dict[Type, List[Dict[str, Any]]] = {}
+        for model, values in rows:
+            grouped.setdefault(model, []).append(values)
+        started = time.perf_counter()
+        try:
+            with self._session_factory() as db:
+                for model, values in grouped.items():
+                    db.execute(insert(model), values)
+                if self._on_flush is not None:
+                    self._on_flush(db, grouped)
+                db.commit()
+        except Exception:
+            logger.exception("write-behind flush of %d rows failed", len(rows))
+            self.failed += len(rows)
+            return 0
+        elapsed = time.perf_counter() - started
+        DB_COMMIT_LATENCY.observe(elapsed)
+        DB_ROWS_WRITTEN.inc(len(rows))
+        self.flushes += 1
+        self.written += len(rows)
+        self.last_flush_ms = elapsed * 1000.0
+        return len(rows)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._stopping and len(self._buf) < self.batch_size:
+                    self._cond.wait(self.interval)
+                rows = self._take()
+                stopping = self._stopping
+            self._write(rows)
+            if stopping:
+                with self._cond:
+                    if not self._buf:
+                        return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            pending = len(self._buf)
+        return {
+            "pending": pending,
+            "max_rows": self.max_rows,
+            "policy": self.policy,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+        }
+
+
+write_behind = WriteBehindLogger()
+
+
+def _collect_writer_metrics():
+    st = write_behind.stats()
+    yield from render_family("maya_writer_pending_rows", "Rows buffered for the next flush", "gauge", [({}, st["pending"])])
+    yield from render_family("maya_writer_rows_total", "Write-behind rows by outcome", "counter",
+                             [({"outcome": k}, st[k]) for k in ("enqueued", "dropped", "failed")])
+
+
+REGISTRY.register_collector(_collect_writer_metrics)
+
+
+def log_query(city: str, query_text: str, response_text: str) -> bool:
+    # Stamp at enqueue time so the row reflects when the request happened
+    return write_behind.enqueue(Query, city=city, query_text=query_text, response_text=response_text, timestamp=datetime.utcnow())
+
+
+def log_weather(city: str, temp: float, humidity: float, condition: str) -> bool:
+    return write_behind.enqueue(WeatherLog, city=city, temp=temp, humidity=humidity, condition=condition, date=datetime.utcnow())
+
+
+# Async handlers and tasks must use these; the sync ones can block the loop under WRITE_BEHIND_POLICY=block
+
+async def alog_query(city: str, query_text: str, response_text: str) -> bool:
+    return await write_behind.aenqueue(Query, city=city, query_text=query_text, response_text=response_text, timestamp=datetime.utcnow())
+
+
+async def alog_weather(city: str, temp: float, humidity: float, condition: str) -> bool:
+    return await write_behind.aenqueue(WeatherLog, city=city, temp=temp, humidity=humidity, condition=condition, date=datetime.utcnow())
@@ -0,0 +1,210 @@
+"""Local stand-ins for OpenWeatherMap and the Gemini REST API.
+
+Both servers sleep for a latency drawn from a configurable distribution and
+fail a configurable fraction of requests, so the backend's real network
+code (connection pools, timeouts, fallbacks) runs under load without
+touching the real services or their quotas.
+
+Latency specs:
+    fixed:MS              always MS milliseconds
+    uniform:LO:HI         uniform between LO and HI ms
+    normal:MEAN:SD        gaussian, clipped at 0
+    lognormal:MEDIAN:SIGMA  lognormal with the given median (ms) and shape
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    """Turn a latency spec into a sampler returning seconds."""
+    kind, _, rest = (spec or "fixed:0").partition(":")
+    args = [float(a) for a in rest.split(":") if a]
+    lock = threading.Lock()
+
+    def locked(fn: Callable[[], float]) -> Callable[[], float]:
+        def sample() -> float:
+            with lock:
+                return max(0.0, fn()) / 1000.0
+        return sample
+
+    if kind == "fixed":
+        return locked(lambda: args[0] if args else 0.0)
+    if kind == "uniform":
+        return locked(lambda: rng.uniform(args[0], args[1]))
+    if kind == "normal":
+        return locked(lambda: rng.gauss(args[0], args[1]))
+    if kind == "lognormal":
+        mu = math.log(max(args[0], 1e-6))
+        return locked(lambda: rng.lognormvariate(mu, args[1]))
+    raise ValueError(f"unknown latency distribution: {spec!r}")
+
+
+class FakeUpstream:
+    """Shared plumbing: a threaded HTTP server with latency and error injection."""
+
+    def __init__(self, latency: str = "fixed:0", error_rate: float = 0.0, seed: int = 0, error_status: int = 500):
+        rng = random.Random(seed)
+        self._latency = parse_latency(latency, rng)
+        self._error_rng = random.Random(seed + 1)
+        self._error_lock = threading.Lock()
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def should_fail(self) -> bool:
+        with self._error_lock:
+            self.requests += 1
+            fail = self._error_rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def delay(self) -> None:
+        time.sleep(self._latency())
+
+    def handle(self, method: str, path: str, query: dict, body: bytes) -> Tuple[int, str, bytes]:
+        raise NotImplementedError
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self, method: str) -> None:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                url = urlparse(self.path)
+                upstream.delay()
+                if upstream.should_fail():
+                    status, ctype, payload = upstream.error_status, "application/json", json.dumps(
+                        {"error": {"code": upstream.error_status, "message": "injected failure"}}
+                    ).encode()
+                else:
+                    status, ctype, payload = upstream.handle(method, url.path, parse_qs(url.query), body)
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._serve("GET")
+
+            def do_POST(self):
+                self._serve("POST")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _city_weather(name: str, city_id: int) -> dict:
+    # Deterministic per-city readings so runs are comparable
+    h = zlib.crc32(name.lower().encode())
+    conditions = ["clear sky", "few clouds", "scattered clouds", "light rain", "haze"]
+    desc = conditions[h % len(conditions)]
+    return {
+        "id": city_id,
+        "name": name,
+        "dt": int(time.time()) // 600 * 600,
+        "main": {"temp": 24 + (h % 120) / 10.0, "humidity": 40 + h % 50},
+        "weather": [{"main": desc.split()[-1].title(), "description": desc}],
+        "rain": {"1h": 0.4} if "rain" in desc else {},
+    }
+
+
+class FakeOWM(FakeUpstream):
+    """Serves /data/2.5/weather?q=... and /data/2.5/group?id=..."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._ids = {}
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def _id_for(self, name: str) -> int:
+        with self._lock:
+            key = name.lower()
+            if key not in self._ids:
+                self._ids[key] = 100000 + len(self._ids)
+                self._names[self._ids[key]] = name
+            return self._ids[key]
+
+    def handle(self, method, path, query, body):
+        if path.endswith("/weather"):
+            name = (query.get("q") or ["Chennai"])[0]
+            return 200, "application/json", json.dumps(_city_weather(name, self._id_for(name))).encode()
+        if path.endswith("/group"):
+            ids = [int(i) for i in (query.get("id") or [""])[0].split(",") if i.isdigit()]
+            items = [_city_weather(self._names[i], i) for i in ids if i in self._names]
+            return 200, "application/json", json.dumps({"cnt": len(items), "list": items}).encode()
+        return 404, "application/json", b'{"cod": "404", "message": "not found"}'
+
+
+_BATCH_LINE = re.compile(r"id=(\d+) \| City: ([^|]+?) \|")
+
+
+def _reply_text(prompt: str) -> str:
+    def one(city: str) -> dict:
+        return {
+            "english": f"{city} looks fine today. Stay hydrated and enjoy!",
+            "tamil": f"{city}-la innaikku nalla weather. Thanni kudinga!",
+            "advice": "Wear light cotton clothes.",
+            "mood_reply": "Innaikku super-a iruku!",
+        }
+
+    batch = _BATCH_LINE.findall(prompt)
+    if batch:
+        return json.dumps([{"id": int(i), "city": c.strip(), **one(c.strip())} for i, c in batch], ensure_ascii=False)
+    m = re.search(r"City: (.+)", prompt)
+    return json.dumps(one(m.group(1).strip() if m else "Chennai"), ensure_ascii=False)
+
+
+class FakeGemini(FakeUpstream):
+    """Serves the generateContent, streamGenerateContent and countTokens REST calls."""
+
+    def handle(self, method, path, query, body):
+        try:
+            req = json.loads(body or b"{}")
+            prompt = "".join(p.get("text", "") for c in req.get("contents", []) for p in c.get("parts", []))
+        except ValueError:
+            prompt = ""
+        if path.endswith(":countTokens"):
+            return 200, "application/json", json.dumps({"totalTokens": max(1, len(prompt) // 4)}).encode()
+        text = _reply_text(prompt)
+
+        def candidate(t: str) -> dict:
+            return {"candidates": [{"content": {"role": "model", "parts": [{"text": t}]}, "finishReason": "STOP", "index": 0}]}
+
+        if path.endswith(":generateContent"):
+            return 200, "application/json", json.dumps(candidate(text), ensure_ascii=False).encode()
+        if path.endswith(":streamGenerateContent"):
+            pieces = [text[i:i + 24] for i in range(0, len(text), 24)]
+            if (query.get("alt") or [""])[0] == "sse":
+                payload = "".join(f"data: {json.dumps(candidate(p), ensure_ascii=False)}\r\n\r\n" for p in pieces)
+                return 200, "text/event-stream", payload.encode()
+            return 200, "application/json", json.dumps([candidate(p) for p in pieces], ensure_ascii=False).encode()
+        return 404, "application/json", b'{"error": {"code": 404, "message": "model not found"}}'
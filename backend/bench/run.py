@@ -0,0 +1,259 @@
+"""Load and latency benchmark for the backend.
+
+Starts the local OWM and Gemini stand-ins from bench/fakes.py and runs the
+app under uvicorn in a subprocess pointed at them. It then drives each
+endpoint at each concurrency level and writes throughput and latency
+percentiles to JSON.
+
+    cd backend
+    python -m bench.run --concurrency 1,8,32 --requests 200 --out bench/results/local.json
+    python -m bench.run ... --compare bench/results/baseline.json
+
+By default, the app's weather and response caches are disabled
+(--caches off) so every request pays the upstream I/O cost. Use
+--caches on to measure the warm path.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from .fakes import FakeGemini, FakeOWM
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CITIES = [
+    "Chennai", "Coimbatore", "Madurai", "Tiruchirappalli", "Salem", "Tirunelveli", "Erode", "Vellore", "Thoothukudi", "Tiruppur",
+    "Dindigul", "Thanjavur", "Kanchipuram", "Nagercoil", "Karur", "Cuddalore", "Nagapattinam", "Pudukkottai", "Sivagangai",
+]
+ENDPOINTS = ("weather", "voice", "route", "chat")
+
+
+def make_request(endpoint: str, rng: random.Random) -> Dict[str, Any]:
+    city = rng.choice(CITIES)
+    if endpoint == "weather":
+        return {"path": "/api/weather", "json": {"city": city}}
+    if endpoint == "voice":
+        return {"path": "/api/voice", "json": {"transcript": f"what's the weather in {city.lower()} today"}}
+    if endpoint == "route":
+        return {"path": "/api/route", "json": {"cities": rng.sample(CITIES, rng.randint(3, 8))}}
+    if endpoint == "chat":
+        return {"path": "/api/chat", "json": {"message": f"Should I carry an umbrella in {city}?", "lang": rng.choice(["en", "ta"]), "context": {"city": city}}}
+    raise ValueError(endpoint)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(endpoint: str, concurrency: int, latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    lat = sorted(x * 1000.0 for x in latencies)
+    total = len(latencies) + errors
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(lat) / len(lat), 2) if lat else 0.0,
+        "p50_ms": round(percentile(lat, 50), 2),
+        "p95_ms": round(percentile(lat, 95), 2),
+        "p99_ms": round(percentile(lat, 99), 2),
+        "max_ms": round(lat[-1], 2) if lat else 0.0,
+    }
+
+
+async def drive(base_url: str, endpoint: str, concurrency: int, total: int, warmup: int, seed: int, timeout: float) -> Dict[str, Any]:
+    rng = random.Random(f"{seed}:{endpoint}:{concurrency}")
+    requests = [make_request(endpoint, rng) for _ in range(warmup + total)]
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        for req in requests[:warmup]:
+            await client.post(req["path"], json=req["json"])
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for req in requests[warmup:]:
+            queue.put_nowait(req)
+
+        async def worker():
+            nonlocal errors
+            while True:
+                try:
+                    req = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                started = time.perf_counter()
+                try:
+                    r = await client.post(req["path"], json=req["json"])
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(endpoint, concurrency, latencies, errors, elapsed)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def start_app(port: int, env: Dict[str, str], workers: int) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=BACKEND_DIR, env={**os.environ, **env})
+
+
+def wait_healthy(base_url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"app exited with code {proc.returncode}")
+        try:
+            if httpx.get(base_url + "/api/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("app did not become healthy")
+
+
+def compare(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    old = {(r["endpoint"], r["concurrency"]): r for r in baseline.get("results", [])}
+    print(f"\nvs {baseline_path} ({baseline.get('meta', {}).get('commit')})")
+    print(f"{'endpoint':<9}{'conc':>5}{'rps':>10}{'Δrps':>9}{'p50':>9}{'Δp50':>9}{'p99':>9}{'Δp99':>9}")
+    for r in current["results"]:
+        b = old.get((r["endpoint"], r["concurrency"]))
+
+        def delta(key: str) -> str:
+            if not b or not b[key]:
+                return "n/a"
+            return f"{(r[key] - b[key]) / b[key] * 100:+.0f}%"
+
+        print(f"{r['endpoint']:<9}{r['concurrency']:>5}{r['throughput_rps']:>10}{delta('throughput_rps'):>9}"
+              f"{r['p50_ms']:>9}{delta('p50_ms'):>9}{r['p99_ms']:>9}{delta('p99_ms'):>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    p.add_argument("--endpoints", default=",".join(ENDPOINTS), help="comma-separated subset of: " + ", ".join(ENDPOINTS))
+    p.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    p.add_argument("--requests", type=int, default=200, help="measured requests per endpoint and level")
+    p.add_argument("--warmup", type=int, default=5)
+    p.add_argument("--owm-latency", default="lognormal:120:0.5", help="see bench/fakes.py for the spec format")
+    p.add_argument("--gemini-latency", default="lognormal:900:0.6")
+    p.add_argument("--owm-error-rate", type=float, default=0.0)
+    p.add_argument("--gemini-error-rate", type=float, default=0.0)
+    p.add_argument("--gemini-error-status", type=int, default=429)
+    p.add_argument("--caches", choices=("on", "off"), default="off")
+    p.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    p.add_argument("--timeout", type=float, default=60.0, help="client timeout per request, seconds")
+    p.add_argument("--seed", type=int, default=1234)
+    p.add_argument("--label", default="")
+    p.add_argument("--out", default="", help="write results JSON here")
+    p.add_argument("--compare", default="", help="baseline results JSON to diff against")
+    args = p.parse_args(argv)
+
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+
+    owm = FakeOWM(latency=args.owm_latency, error_rate=args.owm_error_rate, seed=args.seed)
+    gemini = FakeGemini(latency=args.gemini_latency, error_rate=args.gemini_error_rate, seed=args.seed + 100,
+                        error_status=args.gemini_error_status)
+    owm_url = owm.start()
+    gemini_url = gemini.start()
+    tmpdir = tempfile.mkdtemp(prefix="maya-bench-")
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    env = {
+        "OWM_API_KEY": "bench",
+        "OWM_BASE_URL": owm_url + "/data/2.5/weather",
+        "GEMINI_API_KEY": "bench",
+        "GEMINI_API_ENDPOINT": gemini_url,
+        "DB_PATH": f"sqlite:///{os.path.join(tmpdir, 'bench.db')}",
+        "WARMER_ENABLED": "0",
+        # The stand-ins have no quotas; measure the app, not the admission control
+        "OWM_RATE_PER_MIN": "0",
+        "GEMINI_RATE_PER_MIN": "0",
+        "GEMINI_MODEL_RATE_PER_MIN": "0",
+    }
+    if args.caches == "off":
+        env.update({"WEATHER_CACHE_TTL": "0", "GEMINI_CACHE_TTL": "0"})
+
+    proc = start_app(port, env, args.workers)
+    results: List[Dict[str, Any]] = []
+    try:
+        wait_healthy(base_url, proc)
+        for endpoint in endpoints:
+            for level in levels:
+                r = asyncio.run(drive(base_url, endpoint, level, args.requests, args.warmup, args.seed, args.timeout))
+                results.append(r)
+                print(f"{r['endpoint']:<8} c={r['concurrency']:<4} {r['throughput_rps']:>8} rps  "
+                      f"p50={r['p50_ms']}ms p95={r['p95_ms']}ms p99={r['p99_ms']}ms errors={r['errors']}", flush=True)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        owm.stop()
+        gemini.stop()
+
+    report = {
+        "meta": {
+            "label": args.label,
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+            "upstream_requests": {"owm": owm.requests, "gemini": gemini.requests},
+        },
+        "results": results,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.out}")
+    if args.compare:
+        compare(report, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,7 @@ export const API_ENDPOINTS = {
   mood: "/mood",
   cities: "/cities",
   chat: "/chat",
+  chatStream: "/chat/stream",
   preferences: "/preferences",
   keys: "/keys",
   geminiModels: "/gemini/models",
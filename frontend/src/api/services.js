@@ -18,11 +18,12 @@ export const weatherService = {
   },
 
   // Get weather for a city
+  // GET so repeat polls revalidate with the browser cache (ETag / 304)
   getWeather: async (city, userQuery = null) => {
-    const response = await apiClient.post(API_ENDPOINTS.weather, {
-      city,
-      user_query: userQuery,
-    });
+    const response = await apiClient.get(
+      `${API_ENDPOINTS.weather}/${encodeURIComponent(city)}`,
+      { params: userQuery ? { q: userQuery } : {} }
+    );
     return response.data;
   },
 
@@ -52,6 +53,43 @@ export const weatherService = {
     return response.data;
   },
 
+  // Streaming chat (Server-Sent Events). onDelta gets partial text as it
+  // arrives; resolves with the final { response, bilingual } payload.
+  chatStream: async (message, lang = "en", context = null, onDelta = () => {}) => {
+    const res = await fetch(`${API_BASE}${API_ENDPOINTS.chatStream}`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+      body: JSON.stringify({ message, lang, context }),
+    });
+    if (!res.ok || !res.body) {
+      throw new Error(`Chat stream failed: ${res.status}`);
+    }
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let final = null;
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let sep;
+      while ((sep = buffer.indexOf("\n\n")) !== -1) {
+        const raw = buffer.slice(0, sep);
+        buffer = buffer.slice(sep + 2);
+        const event = (raw.match(/^event: (.*)$/m) || [])[1];
+        const data = (raw.match(/^data: (.*)$/m) || [])[1];
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (event === "delta") onDelta(payload.text);
+        else if (event === "done") final = payload;
+      }
+    }
+    if (!final) {
+      throw new Error("Chat stream ended without a final event");
+    }
+    return final;
+  },
+
   // Get mood
   getMood: async (text) => {
     const response = await apiClient.post(API_ENDPOINTS.mood, {
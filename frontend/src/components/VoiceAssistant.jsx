@@ -99,6 +99,21 @@ const VoiceAssistant = ({ isOpen, onClose, language, currentCity, currentWeather
     }
   };
 
+  // Queue one piece of text without interrupting what is already being spoken
+  const speakQueued = (text) => {
+    if (!text.trim() || !('speechSynthesis' in window)) return;
+    const utterance = new SpeechSynthesisUtterance(text);
+    utterance.lang = language === 'ta' ? 'ta-IN' : 'en-IN';
+    utterance.rate = 0.9;
+    utterance.pitch = 1;
+
+    utterance.onstart = () => setIsSpeaking(true);
+    utterance.onend = () => setIsSpeaking(synthRef.current.pending);
+    utterance.onerror = () => setIsSpeaking(false);
+
+    synthRef.current.speak(utterance);
+  };
+
   const handleSendMessage = async (text = inputText) => {
     if (!text.trim()) return;
 
@@ -112,17 +127,48 @@ const VoiceAssistant = ({ isOpen, onClose, language, currentCity, currentWeather
         weather: currentWeather
       };
 
-      const data = await weatherService.chat(text, language, context);
+      // Stream the reply and start speaking at the first full sentence
+      synthRef.current.cancel();
+      let streamed = '';
+      let spokenUpTo = 0;
+      setMessages((prev) => [...prev, { text: '', sender: 'assistant' }]);
+      const updateLast = (value) =>
+        setMessages((prev) => [...prev.slice(0, -1), { text: value, sender: 'assistant' }]);
 
-      const assistantMessage = { text: data.response, sender: 'assistant' };
-      setMessages((prev) => [...prev, assistantMessage]);
-      speak(data.response);
+      let data;
+      try {
+        data = await weatherService.chatStream(text, language, context, (delta) => {
+          streamed += delta;
+          updateLast(streamed);
+          const boundary = Math.max(
+            streamed.lastIndexOf('. '), streamed.lastIndexOf('! '), streamed.lastIndexOf('? ')
+          );
+          if (boundary + 1 > spokenUpTo) {
+            speakQueued(streamed.slice(spokenUpTo, boundary + 1));
+            spokenUpTo = boundary + 1;
+          }
+        });
+      } catch (streamError) {
+        // Fall back to the non-streaming endpoint
+        console.error('Streaming chat failed, retrying without streaming:', streamError);
+        data = await weatherService.chat(text, language, context);
+        streamed = '';
+        spokenUpTo = 0;
+      }
+
+      updateLast(data.response);
+      if (data.response.startsWith(streamed) && spokenUpTo > 0) {
+        speakQueued(data.response.slice(spokenUpTo));
+      } else {
+        speak(data.response);
+      }
     } catch (error) {
       console.error('Error sending message:', error);
       const errorMsg = language === 'ta'
         ? 'மன்னிக்கவும், எனக்கு இப்போது சிக்கல் உள்ளது.'
         : 'Sorry, I\'m having trouble right now.';
-      setMessages((prev) => [...prev, { text: errorMsg, sender: 'assistant' }]);
+      // Drop the empty placeholder left by a failed stream
+      setMessages((prev) => [...prev.filter((m) => m.text !== ''), { text: errorMsg, sender: 'assistant' }]);
     }
   };
 